@@ -3,19 +3,19 @@
 
 VERSION = "2.2.0"
 
+import atexit
+import functools
 import json
+import operator
 import os
 import re
-import shutil
 import signal
-import subprocess
+import stat
+import struct
 import sys
 import time
-import urllib.request
-import urllib.error
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from urllib.parse import urlparse
 
 DEFAULT_CACHE_TTL = 60
 BAR_SIZES = {"small": 4, "medium": 8, "large": 12}
@@ -36,15 +36,53 @@ BAR_STYLES = {
 DEFAULT_BAR_STYLE = "classic"
 
 # Precompute all bar characters for rainbow detection
-ALL_BAR_CHARS = set()
-for _f, _e in BAR_STYLES.values():
-    ALL_BAR_CHARS.add(_f)
-    ALL_BAR_CHARS.add(_e)
+ALL_BAR_CHARS = frozenset(ch for pair in BAR_STYLES.values() for ch in pair)
 
 # Text layouts — controls how labels, bars, and percentages are arranged
 LAYOUTS = ("standard", "compact", "minimal", "percent-first")
 DEFAULT_LAYOUT = "standard"
 
+# Per-layout section templates, resolved once per render in build_status_line.
+# Unknown layouts fall back to standard.
+LAYOUT_TEMPLATES = {
+    "standard": {
+        "session": "{label} {bar} {pct:.0f}%{reset}",
+        "session_zero": "Session {bar} 0%",
+        "weekly": "Weekly {bar} {pct:.0f}%{reset}",
+        "extra_amount": "Extra {used}",
+        "extra_bar": "Extra {bar} {used}/{limit}",
+        "extra_none": "Extra {bar} none",
+        "context": "Context {bar} {label}",
+    },
+    "compact": {
+        "session": "S {bar} {pct:.0f}%{reset}",
+        "session_zero": "S {bar} 0%",
+        "weekly": "W {bar} {pct:.0f}%{reset}",
+        "extra_amount": "E {used}",
+        "extra_bar": "E {bar} {used}/{limit}",
+        "extra_none": "Extra {bar} none",
+        "context": "C {bar} {label}",
+    },
+    "minimal": {
+        "session": "{bar} {pct:.0f}%{reset}",
+        "session_zero": "{bar} 0%",
+        "weekly": "{bar} {pct:.0f}%{reset}",
+        "extra_amount": "{used}",
+        "extra_bar": "{bar} {used}",
+        "extra_none": "{bar} none",
+        "context": "{bar} {label}",
+    },
+    "percent-first": {
+        "session": "{pct:.0f}% {bar}{reset}",
+        "session_zero": "0% {bar}",
+        "weekly": "{pct:.0f}% {bar}{reset}",
+        "extra_amount": "Extra {used}",
+        "extra_bar": "{used} {bar}",
+        "extra_none": "Extra {bar} none",
+        "context": "{label} {bar}",
+    },
+}
+
 # ANSI colour codes
 GREEN = "\033[32m"
 YELLOW = "\033[33m"
@@ -73,6 +111,11 @@ CANDY_PINK = "\033[38;5;213m"
 CANDY_PURPLE = "\033[38;5;141m"
 CANDY_CYAN = "\033[38;5;51m"
 
+# Pre-rendered --bar-style listing — BAR_STYLES is static, so build it once
+_BAR_STYLE_DEMO_BYTES = "".join(
+    f"  {name:<10} {GREEN}{fc * 4}{DIM}{ec * 4}{RESET}\n" for name, (fc, ec) in BAR_STYLES.items()
+).encode("utf-8")
+
 # Theme definitions — each maps usage levels to ANSI colour codes
 # "rainbow" uses representative colours for previews; actual rendering is animated
 THEMES = {
@@ -118,12 +161,24 @@ MODEL_CONTEXT_WINDOWS = {
 }
 DEFAULT_CONTEXT_WINDOW = 200_000
 
+# CSI (\x1b[...), OSC (\x1b]...), DCS (\x1bP...) and other escape sequences
+_ESCAPE_SEQ_SUB = re.compile(r'\x1b[^a-zA-Z]*[a-zA-Z]').sub
+# Remaining control characters (keep \n for multi-line contexts)
+_CONTROL_CHARS_TABLE = dict.fromkeys([*range(0x00, 0x0a), *range(0x0b, 0x20), *range(0x7f, 0xa0)])
+
+
 def _sanitize(text):
     """Strip ANSI/terminal escape sequences and control characters from untrusted strings."""
-    # Strip CSI (\x1b[...), OSC (\x1b]...), DCS (\x1bP...) and other escape sequences
-    cleaned = re.sub(r'\x1b[^a-zA-Z]*[a-zA-Z]', '', str(text))
-    # Strip remaining control characters (keep \n for multi-line contexts)
-    return re.sub(r'[\x00-\x09\x0b-\x1f\x7f-\x9f]', '', cleaned)
+    text = str(text)
+    if text.isprintable():  # no ESC or control characters — nothing to strip
+        return text
+    return _sanitize_str(text)
+
+
+@functools.lru_cache(maxsize=256)
+def _sanitize_str(text):
+    """Cached body of _sanitize — config values like the timer prefix repeat every render."""
+    return _ESCAPE_SEQ_SUB('', text).translate(_CONTROL_CHARS_TABLE)
 
 # Named text colours for non-bar text (labels, percentages, separators)
 TEXT_COLORS = {
@@ -157,6 +212,12 @@ THEME_DEMO_TEXT = {
     "rainbow": "none",
 }
 
+# Static low/mid/high preview bar per theme (rainbow is rendered live)
+_PREVIEW_BAR = {
+    name: f"{c['low']}{FILL * 3}{c['mid']}{FILL * 3}{c['high']}{FILL * 2}{RESET}"
+    for name, c in THEMES.items() if name != "rainbow"
+}
+
 # Recommended text colour per theme — chosen for good contrast with bars
 # so the rainbow has something to contrast against
 THEME_TEXT_DEFAULTS = {
@@ -191,7 +252,12 @@ DEFAULT_SHOW = {
 
 # Sparkline and history constants
 SPARKLINE_CHARS = "\u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588"
+# Whole-percent lookup: maps 0-100 to index 0-6 (avoid █ at index 7 — it's in ALL_BAR_CHARS)
+_SPARK_TABLE = tuple(SPARKLINE_CHARS[min(6, int(v / 100 * 6.99))] for v in range(101))
 HISTORY_MAX_AGE = 86400  # 24 hours in seconds
+HISTORY_MAX_SAMPLES = 2000
+# history.bin record: timestamp, session %, weekly % (little-endian, 16 bytes)
+HISTORY_RECORD = struct.Struct("<dff")
 
 
 # ---------------------------------------------------------------------------
@@ -224,6 +290,32 @@ def hsv_to_rgb(h, s, v):
     return vi, p, q
 
 
+# Tokenizer for rainbow_colorize: an SGR escape (capped at 25 chars, like the
+# terminal-safe scan it replaces), a run of plain text, or a stray ESC.
+_ANSI_TOKEN_RE = re.compile(r"(\x1b[^m]{0,24}m)|([^\x1b]+|\x1b)")
+
+# Rainbow palette — one truecolor escape per hue step.
+# 0.025 hue per character (full rainbow every 40 chars) is exactly 6 steps here.
+RAINBOW_STEPS = 240
+RAINBOW_CHAR_STEP = 6
+_RAINBOW_BAND_LEN = RAINBOW_STEPS // RAINBOW_CHAR_STEP
+
+
+@functools.lru_cache(maxsize=1)
+def _rainbow_bands():
+    """Build the palette on first use, split by start offset into bands.
+
+    Consecutive characters walk one band in order. Each band is repeated so a
+    run of up to 3 laps (~120 chars) is a single slice. Built lazily because
+    the HSV maths would otherwise cost every non-rainbow refresh at import.
+    """
+    lut = tuple(
+        f"\033[38;2;{r};{g};{b}m"
+        for r, g, b in (hsv_to_rgb(i / RAINBOW_STEPS, 0.92, 0.95) for i in range(RAINBOW_STEPS))
+    )
+    return tuple(lut[r::RAINBOW_CHAR_STEP] * 4 for r in range(RAINBOW_CHAR_STEP))
+
+
 def rainbow_colorize(text, color_all=True, shimmer=True):
     """Apply rainbow colouring — animated when processing, clean static when idle.
 
@@ -237,55 +329,66 @@ def rainbow_colorize(text, color_all=True, shimmer=True):
 
     if shimmer:
         # Rainbow hue drift — shifts the entire gradient each frame
-        hue_drift = now * 0.8
+        hue_base = int(now * 0.8 * RAINBOW_STEPS) % RAINBOW_STEPS
     else:
         # Static mode — fixed hue offset so the rainbow looks clean when frozen
-        hue_drift = 0.0
+        hue_base = 0
 
+    bands = _rainbow_bands()
     result = []
     visible_idx = 0
     has_existing_color = False
-    i = 0
-
-    while i < len(text):
-        # Handle ANSI escape sequences
-        if text[i] == "\033":
-            j = i
-            while j < len(text) and j - i < 25 and text[j] != "m":
-                j += 1
-            if j >= len(text) or text[j] != "m":
-                # Malformed escape — treat \033 as regular character
-                result.append(text[i])
-                i += 1
-                visible_idx += 1
-                continue
-            seq = text[i : j + 1]
+    prev_code = None  # rainbow colour currently active in the output, if any
+
+    # Text without any ESC (names, previews) is a single visible run — skip the tokenizer
+    if "\033" not in text:
+        tokens = (("", text),) if text else ()
+    else:
+        tokens = _ANSI_TOKEN_RE.findall(text)
 
+    for seq, plain in tokens:
+        # ANSI escape sequence
+        if seq:
             if color_all:
-                i = j + 1
                 continue
+            if seq == "\033[0m":
+                has_existing_color = False
             else:
-                if seq == "\033[0m":
-                    has_existing_color = False
-                else:
-                    has_existing_color = True
-                result.append(seq)
-                i = j + 1
-                continue
-
-        # Visible character
-        if not color_all and has_existing_color:
-            result.append(text[i])
-        else:
-            # Wider bands: 0.025 per char = full rainbow every ~40 chars
-            hue = ((visible_idx * 0.025) + hue_drift) % 1.0
+                has_existing_color = True
+                # Close the rainbow run so the existing colour starts clean
+                if prev_code:
+                    result.append(RESET)
+            prev_code = None
+            result.append(seq)
+            continue
 
-            # Vivid rainbow: high saturation and brightness
-            r, g, b = hsv_to_rgb(hue, 0.92, 0.95)
-            result.append(f"\033[38;2;{r};{g};{b}m{text[i]}\033[0m")
+        # Malformed escape — treat \033 as regular character
+        if plain == "\033":
+            if prev_code:
+                result.append(RESET)
+                prev_code = None
+            result.append(plain)
+            visible_idx += 1
+            continue
 
-        visible_idx += 1
-        i += 1
+        # Run of visible characters
+        if not color_all and has_existing_color:
+            result.append(plain)
+            visible_idx += len(plain)
+            continue
+        # Wider bands: full rainbow every ~40 chars, vivid truecolor palette.
+        # Neighbouring characters never share a colour, so each gets its own SGR;
+        # the run's codes are one slice of a band, zipped with the text in C.
+        start = visible_idx * RAINBOW_CHAR_STEP + hue_base
+        band = bands[start % RAINBOW_CHAR_STEP]
+        offset = (start // RAINBOW_CHAR_STEP) % _RAINBOW_BAND_LEN
+        n = len(plain)
+        if offset + n > len(band):
+            band *= (offset + n) // len(band) + 1
+        codes = band[offset:offset + n]
+        result.append("".join(map(operator.add, codes, plain)))
+        prev_code = codes[-1]
+        visible_idx += n
 
     result.append(RESET)
     return "".join(result)
@@ -293,13 +396,20 @@ def rainbow_colorize(text, color_all=True, shimmer=True):
 
 def resolve_text_color(config):
     """Return the ANSI code for the configured text colour."""
-    theme_name = config.get("theme", "default")
-    tc = config.get("text_color", "auto")
+    return _text_color_code(config.get("text_color", "auto"), config.get("theme", "default"))
+
+
+@functools.lru_cache(maxsize=64)
+def _text_color_code(tc, theme_name):
+    """Resolve a text colour name (or 'auto' for the theme's default) to its ANSI code."""
     if tc == "auto":
         tc = THEME_TEXT_DEFAULTS.get(theme_name, "white")
     return TEXT_COLORS.get(tc, TEXT_COLORS["white"])
 
 
+_RESET_PLUS_COLOR = {}  # color_code -> RESET + color_code
+
+
 def apply_text_color(line, color_code):
     """Wrap non-bar text in a base colour so the rainbow has something to contrast against.
 
@@ -308,9 +418,14 @@ def apply_text_color(line, color_code):
     """
     if not color_code:
         return line
+    if RESET not in line:
+        return color_code + line + RESET
     # Prepend base colour, replace every \033[0m with \033[0m + base colour,
     # then append a final reset at the end
-    return color_code + line.replace("\033[0m", "\033[0m" + color_code) + "\033[0m"
+    repl = _RESET_PLUS_COLOR.get(color_code)
+    if repl is None:
+        repl = _RESET_PLUS_COLOR[color_code] = RESET + color_code
+    return color_code + line.replace(RESET, repl) + RESET
 
 
 
@@ -321,9 +436,14 @@ def apply_text_color(line, color_code):
 def _secure_mkdir(path):
     """Create directory with 0o700 permissions on Unix. Normal mkdir on Windows."""
     path = Path(path)
-    if path.is_symlink():
+    # One lstat answers both "already there?" and "is it a symlink?"
+    try:
+        is_link = stat.S_ISLNK(os.lstat(path).st_mode)
+    except FileNotFoundError:
+        is_link = None
+    if is_link:
         path.unlink()
-    if path.exists():
+    elif is_link is not None:
         return
     if sys.platform == "win32":
         path.mkdir(parents=True, exist_ok=True)
@@ -335,8 +455,11 @@ def _secure_mkdir(path):
             os.umask(old_umask)
 
 
-def _secure_open_write(filepath):
-    """Open file for writing with 0o600 permissions on Unix. Normal open on Windows."""
+def _secure_open_write(filepath, binary=False, append=False):
+    """Open file for writing with 0o600 permissions on Unix. Normal open on Windows.
+
+    append=True opens a binary file for appending instead of truncating it.
+    """
     filepath = Path(filepath)
     if filepath.is_symlink():
         filepath.unlink()
@@ -346,16 +469,27 @@ def _secure_open_write(filepath):
         expected = filepath.parent.resolve() / filepath.name
         if resolved != expected:
             raise OSError(f"Path resolves unexpectedly: {resolved}")
-        return open(filepath, "w", encoding="utf-8")
-    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+        if append:
+            return open(filepath, "ab")
+        return open(filepath, "wb") if binary else open(filepath, "w", encoding="utf-8")
+    if append:
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        binary = True
+    else:
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
     if hasattr(os, "O_NOFOLLOW"):
         flags |= os.O_NOFOLLOW
     fd = os.open(str(filepath), flags, 0o600)
-    return os.fdopen(fd, "w", encoding="utf-8")
+    return os.fdopen(fd, "wb") if binary else os.fdopen(fd, "w", encoding="utf-8")
 
 
 def _atomic_json_write(filepath, data, indent=2):
-    """Atomically write JSON with 0o600 permissions on Unix.
+    """Atomically write JSON with 0o600 permissions on Unix."""
+    _atomic_write(filepath, json.dumps(data, indent=indent))
+
+
+def _atomic_write(filepath, text):
+    """Atomically write text with 0o600 permissions on Unix.
 
     Writes to a .tmp sibling first, then uses os.replace() for an atomic swap.
     Cleans up the temp file on failure.
@@ -364,7 +498,7 @@ def _atomic_json_write(filepath, data, indent=2):
     tmp_path = filepath.with_suffix(".tmp")
     try:
         with _secure_open_write(tmp_path) as f:
-            json.dump(data, f, indent=indent)
+            f.write(text)
         os.replace(str(tmp_path), str(filepath))
     except BaseException:
         try:
@@ -374,19 +508,31 @@ def _atomic_json_write(filepath, data, indent=2):
         raise
 
 
+def _read_json(filepath):
+    """Parse a JSON file from its raw bytes, read in one call (no text-layer copy)."""
+    with open(filepath, "rb") as f:
+        return json.loads(f.read())
+
+
 # ---------------------------------------------------------------------------
 # Config
 # ---------------------------------------------------------------------------
 
+@functools.lru_cache(maxsize=1)
+def _script_path():
+    """Resolved path of this script, computed once (resolve() walks every component)."""
+    return Path(__file__).resolve()
+
+
+@functools.lru_cache(maxsize=1)
+def _claude_dir():
+    """Claude Code's per-user directory (~/.claude), resolved once per process."""
+    return Path.home() / ".claude"
+
+
 def get_config_path():
     """Return path to user config — stored alongside cache, outside the repo."""
-    if sys.platform == "win32":
-        base = Path(os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local"))
-    else:
-        base = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
-    config_dir = base / "claude-status"
-    _secure_mkdir(config_dir)
-    return config_dir / "config.json"
+    return get_state_dir() / "config.json"
 
 
 def load_config():
@@ -397,8 +543,7 @@ def load_config():
     data = {}
     for path in (user_path, repo_path):
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            data = _read_json(path)
             break
         except (FileNotFoundError, json.JSONDecodeError):
             continue
@@ -439,14 +584,19 @@ def _cleanup_hooks():
     """
     state_dir = get_state_dir()
     marker = state_dir / "hooks_cleaned"
-    if marker.exists():
+    if os.path.exists(marker):
         return
-    settings_path = Path.home() / ".claude" / "settings.json"
+    settings_path = _claude_dir() / "settings.json"
+    script_name = "claude_status.py"
     try:
         with open(settings_path, "r", encoding="utf-8") as f:
-            settings = json.load(f)
+            raw = f.read()
+        # Only parse when our script is mentioned at all — otherwise nothing to clean
+        settings = json.loads(raw) if script_name in raw else None
     except (FileNotFoundError, json.JSONDecodeError):
-        # No settings file or invalid — nothing to clean
+        settings = None
+    if not isinstance(settings, dict):
+        # No settings file, invalid, or no claude-pulse hooks — nothing to clean
         try:
             with _secure_open_write(marker) as f:
                 pass
@@ -455,7 +605,6 @@ def _cleanup_hooks():
         return
 
     changed = False
-    script_name = "claude_status.py"
     for hook_type in ("UserPromptSubmit", "PreToolUse", "PostToolUse", "Stop"):
         hooks = settings.get("hooks", {}).get(hook_type, [])
         if hooks:
@@ -486,39 +635,179 @@ def _cleanup_hooks():
 # re-render each call without re-hitting the API.
 # ---------------------------------------------------------------------------
 
+@functools.lru_cache(maxsize=1)
 def get_state_dir():
-    """Return the shared state/cache directory."""
+    """Return the shared state/cache directory (created and checked once per process)."""
+    # Path.home() only when the environment doesn't name the base directly
     if sys.platform == "win32":
-        base = Path(os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local"))
+        base = os.environ.get("LOCALAPPDATA")
+        if base is None:
+            base = Path.home() / "AppData" / "Local"
     else:
-        base = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
-    state_dir = base / "claude-status"
+        base = os.environ.get("XDG_CACHE_HOME")
+        if base is None:
+            base = Path.home() / ".cache"
+    state_dir = Path(base) / "claude-status"
     _secure_mkdir(state_dir)
     return state_dir
 
 
+@functools.lru_cache(maxsize=1)
 def get_cache_path():
-    return get_state_dir() / "cache.json"
+    """Return path to the consolidated state file (status cache + update checks)."""
+    return get_state_dir() / "state.json"
+
+
+# State file sections — each carries its own timestamp and TTL
+STATUS_KEY = "status"            # rendered line + usage from the last fetch
+LAST_GOOD_KEY = "last_good"      # last successful fetch, served while the API errors
+PULSE_UPDATE_KEY = "pulse_update"
+CLAUDE_UPDATE_KEY = "claude_update"
+USAGE_VALIDATORS_KEY = "usage_validators"  # ETag/Last-Modified of the last_good fetch
+CLAUDE_VERSION_KEY = "claude_version"      # `claude --version` output, keyed on the binary's mtime
+STREAK_KEY = "streak"                      # current streak mirrored from stats.json for renders
+
+_state = None          # parsed state.json, read at most once per process
+_state_changes = {}    # section -> new value (None = remove), flushed once at exit
+_state_is_new = False  # no state.json yet — the first save removes the legacy files
 
+# Per-section cache files that state.json replaced
+_LEGACY_STATE_FILES = ("cache.json", "update_check.json", "claude_code_update.json")
+
+
+def load_state():
+    """Return the shared state dict, reading state.json once per process."""
+    global _state, _state_is_new
+    if _state is None:
+        try:
+            _state = _read_json(get_cache_path())
+        except FileNotFoundError:
+            _state = {}
+            _state_is_new = True
+        except (json.JSONDecodeError, OSError):
+            _state = {}
+        if not isinstance(_state, dict):
+            _state = {}
+    return _state
+
+
+def update_state(key, value):
+    """Set a state section (None removes it). Written once at process exit."""
+    state = load_state()
+    if value is None:
+        state.pop(key, None)
+    else:
+        state[key] = value
+    if not _state_changes:
+        atexit.register(save_state)
+    _state_changes[key] = value
 
 
+def save_state():
+    """Flush pending state changes in a single atomic write.
+
+    Re-reads the file first and applies only this process's changes, so
+    concurrent status line processes don't clobber each other's sections.
+    """
+    global _state_is_new
+    if not _state_changes:
+        return
+    try:
+        data = _read_json(get_cache_path())
+        if not isinstance(data, dict):
+            data = {}
+    except (FileNotFoundError, json.JSONDecodeError, OSError):
+        data = {}
+    for key, value in _state_changes.items():
+        if value is None:
+            data.pop(key, None)
+        else:
+            data[key] = value
+    _state_changes.clear()
+    try:
+        _atomic_json_write(get_cache_path(), data, indent=None)
+    except OSError:
+        return
+    if _state_is_new:
+        _state_is_new = False
+        for name in _LEGACY_STATE_FILES:
+            try:
+                (get_state_dir() / name).unlink()  # migrated to state.json
+            except OSError:
+                pass
+
 
 # ---------------------------------------------------------------------------
 # Update checker — compares local git HEAD to GitHub remote (cached 1 hour)
 # ---------------------------------------------------------------------------
 
 UPDATE_CHECK_TTL = 3600  # check at most once per hour
+CLAUDE_VERSION_TTL = 21600  # re-run `claude --version` at least every 6 hours
 GITHUB_REPO = "NoobyGains/claude-pulse"
-_GIT_PATH = shutil.which("git") or "git"  # resolve once at import time
-_CLAUDE_PATH = shutil.which("claude")  # resolve once at import time
+# subprocess, urllib.request and urllib.parse are imported lazily inside the
+# update, credential and fetch paths — a cache-hit render never needs them.
+# shutil is imported where it is used.
+
+
+@functools.lru_cache(maxsize=None)
+def _which(name):
+    """Resolve an executable on PATH once per process."""
+    import shutil
+    return shutil.which(name)
+
+
+def _git_path():
+    return _which("git") or "git"
+
+
+def _claude_path():
+    return _which("claude")
+
+_SHA_RE = re.compile(r'[0-9a-f]{40}')
+_VERSION_SANITIZE_RE = re.compile(r'[^a-zA-Z0-9.\-]')
+_VERSION_LINE_RE = re.compile(rb'^VERSION\s*=\s*"([^"]*)"', re.M)  # VERSION = "1.7.0"
+_VERSION_PROBE_BYTES = 2048  # VERSION sits near the top of the script
+
+
+def _read_git_head(git_dir):
+    """Resolve HEAD by reading .git files directly. Returns the SHA or None."""
+    try:
+        head = (git_dir / "HEAD").read_text(encoding="utf-8").strip()
+        if not head.startswith("ref: "):
+            return head if _SHA_RE.fullmatch(head) else None  # detached HEAD
+        ref = head[5:].strip()
+        if not ref.startswith("refs/"):
+            return None
+        try:
+            sha = (git_dir / ref).read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            # Ref has been packed — look it up in packed-refs ("<sha> <ref>" lines)
+            sha = None
+            with open(git_dir / "packed-refs", "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 2 and parts[1] == ref:
+                        sha = parts[0]
+                        break
+        if sha and _SHA_RE.fullmatch(sha):
+            return sha
+    except (OSError, UnicodeDecodeError):
+        pass
+    return None
 
 
 def get_local_commit():
     """Get the local git HEAD commit hash (short). Returns None on failure."""
-    repo_dir = Path(__file__).resolve().parent
+    repo_dir = _script_path().parent
+    # Read .git directly to avoid spawning git; fall back for layouts like
+    # worktrees/submodules where .git is a file pointing elsewhere
+    sha = _read_git_head(repo_dir / ".git")
+    if sha:
+        return sha
     try:
+        import subprocess
         result = subprocess.run(
-            [_GIT_PATH, "rev-parse", "HEAD"],
+            [_git_path(), "rev-parse", "HEAD"],
             capture_output=True, text=True, timeout=5,
             cwd=str(repo_dir),
         )
@@ -532,6 +821,7 @@ def get_local_commit():
 def get_remote_commit():
     """Fetch the latest commit hash from GitHub API. Returns None on failure."""
     try:
+        import urllib.request
         url = f"https://api.github.com/repos/{GITHUB_REPO}/commits/master"
         req = urllib.request.Request(url, headers={
             "Accept": "application/vnd.github.sha",
@@ -539,7 +829,7 @@ def get_remote_commit():
         })
         with urllib.request.urlopen(req, timeout=3) as resp:
             sha = resp.read(1024).decode().strip()
-        if re.fullmatch(r'[0-9a-f]{40}', sha):
+        if _SHA_RE.fullmatch(sha):
             return sha
         return None  # not a valid SHA — rate-limited, error page, etc.
     except Exception:
@@ -551,17 +841,10 @@ def check_for_update():
 
     Cached for 1 hour. Fully silent on any error — never blocks the status line.
     """
-    state_dir = get_state_dir()
-    update_cache = state_dir / "update_check.json"
-
     # Read cached result
-    try:
-        with open(update_cache, "r", encoding="utf-8") as f:
-            cached = json.load(f)
-        if time.time() - cached.get("timestamp", 0) < UPDATE_CHECK_TTL:
-            return cached.get("update_available", False)
-    except (FileNotFoundError, json.JSONDecodeError, KeyError):
-        pass
+    cached = read_cache(PULSE_UPDATE_KEY, UPDATE_CHECK_TTL)
+    if cached is not None:
+        return cached.get("update_available", False)
 
     # Perform the check
     local = get_local_commit()
@@ -575,106 +858,122 @@ def check_for_update():
     update_available = local != remote
 
     # Cache the result
-    try:
-        with _secure_open_write(update_cache) as f:
-            json.dump({
-                "timestamp": time.time(),
-                "update_available": update_available,
-                "local": local[:8],
-                "remote": remote[:8],
-            }, f)
-    except OSError:
-        pass
+    update_state(PULSE_UPDATE_KEY, {
+        "timestamp": time.time(),
+        "update_available": update_available,
+        "local": local[:8],
+        "remote": remote[:8],
+    })
 
     return update_available
 
 
-def append_update_indicator(line, config=None):
+def append_update_indicator(line, config=None, available=None):
     """Append a visible update indicator if a newer version is available."""
+    # Gate on the config before any cache read or network check
+    show = config.get("show", DEFAULT_SHOW) if config else DEFAULT_SHOW
+    if not show.get("update", True):
+        return line
     try:
-        if config:
-            show = config.get("show", DEFAULT_SHOW)
-            if not show.get("update", True):
-                return line
-        if check_for_update():
+        if available is None:  # not already checked by _prefetch_update_checks
+            available = check_for_update()
+        if available:
             return line + f" {BRIGHT_YELLOW}\u2191 Pulse Update{RESET}"
     except Exception:
         pass  # never break the status line for an update check
     return line
 
 
-def check_claude_code_update():
-    """Check if a newer Claude Code version is available on npm. Returns True/False/None.
+def _claude_local_version(claude_path):
+    """Return the installed Claude Code version, or None.
 
-    Cached for 1 hour. Fully silent on any error — never blocks the status line.
+    Spawning `claude --version` dwarfs everything else here, so the result is
+    kept in the state file until the binary changes or CLAUDE_VERSION_TTL expires.
     """
-    if not _CLAUDE_PATH:
-        return None
-
-    state_dir = get_state_dir()
-    update_cache = state_dir / "claude_code_update.json"
-
-    # Read cached result
     try:
-        with open(update_cache, "r", encoding="utf-8") as f:
-            cached = json.load(f)
-        if time.time() - cached.get("timestamp", 0) < UPDATE_CHECK_TTL:
-            return cached.get("update_available", False)
-    except (FileNotFoundError, json.JSONDecodeError, KeyError):
-        pass
-
-    # Get installed version
+        mtime = os.stat(claude_path).st_mtime_ns
+    except OSError:
+        return None
+    cached = read_cache(CLAUDE_VERSION_KEY, CLAUDE_VERSION_TTL)
+    if cached is not None and cached.get("path") == claude_path and cached.get("mtime") == mtime:
+        return cached.get("version")
     try:
+        import subprocess
         result = subprocess.run(
-            [_CLAUDE_PATH, "--version"],
+            [claude_path, "--version"],
             capture_output=True, text=True, timeout=3,
         )
         if result.returncode != 0:
             return None
         # Parse "2.1.37 (Claude Code)" → "2.1.37"
-        local_version = result.stdout.strip().split()[0]
+        version = _sanitize(result.stdout.strip().split()[0])
     except Exception:
         return None
+    update_state(CLAUDE_VERSION_KEY, {
+        "timestamp": time.time(),
+        "path": claude_path,
+        "mtime": mtime,
+        "version": version,
+    })
+    return version
+
+
+def check_claude_code_update():
+    """Check if a newer Claude Code version is available on npm. Returns True/False/None.
+
+    Cached for 1 hour. Fully silent on any error — never blocks the status line.
+    """
+    claude_path = _claude_path()
+    if not claude_path:
+        return None
+
+    # Read cached result
+    cached = read_cache(CLAUDE_UPDATE_KEY, UPDATE_CHECK_TTL)
+    if cached is not None:
+        return cached.get("update_available", False)
+
+    local_version = _claude_local_version(claude_path)
+    if not local_version:
+        return None
 
     # Get latest version from npm registry
     try:
+        import urllib.request
         req = urllib.request.Request(
             "https://registry.npmjs.org/@anthropic-ai/claude-code/latest",
             headers={"User-Agent": "claude-pulse-update-checker"},
         )
         with urllib.request.urlopen(req, timeout=3) as resp:
-            data = json.loads(resp.read(100_000).decode("utf-8"))
+            data = json.loads(resp.read(100_000))
         remote_version = _sanitize(str(data.get("version", "")))
         if not remote_version:
             return None
     except Exception:
         return None
 
-    update_available = _sanitize(local_version) != remote_version
+    update_available = local_version != remote_version
 
     # Cache the result
-    try:
-        with _secure_open_write(update_cache) as f:
-            json.dump({
-                "timestamp": time.time(),
-                "update_available": update_available,
-                "local": _sanitize(local_version),
-                "remote": remote_version,
-            }, f)
-    except OSError:
-        pass
+    update_state(CLAUDE_UPDATE_KEY, {
+        "timestamp": time.time(),
+        "update_available": update_available,
+        "local": local_version,
+        "remote": remote_version,
+    })
 
     return update_available
 
 
-def append_claude_update_indicator(line, config=None):
+def append_claude_update_indicator(line, config=None, available=None):
     """Append a visible Claude Code update indicator if a newer version is available."""
+    # Gate on the config before any cache read or network check
+    show = config.get("show", DEFAULT_SHOW) if config else DEFAULT_SHOW
+    if not show.get("claude_update", True):
+        return line
     try:
-        if config:
-            show = config.get("show", DEFAULT_SHOW)
-            if not show.get("claude_update", True):
-                return line
-        if check_claude_code_update():
+        if available is None:  # not already checked by _prefetch_update_checks
+            available = check_claude_code_update()
+        if available:
             return line + f" {BRIGHT_YELLOW}\u2191 Claude Update{RESET}"
     except Exception:
         pass  # never break the status line for an update check
@@ -684,11 +983,13 @@ def append_claude_update_indicator(line, config=None):
 def _read_version_from_file(script_path):
     """Read VERSION from a script file on disk (may differ from in-memory VERSION after git pull)."""
     try:
-        with open(script_path, "r", encoding="utf-8") as f:
-            for line in f:
-                if line.startswith("VERSION"):
-                    # VERSION = "1.7.0"
-                    return line.split('"')[1]
+        with open(script_path, "rb") as f:
+            data = f.read(_VERSION_PROBE_BYTES)
+            m = _VERSION_LINE_RE.search(data)
+            if not m:
+                m = _VERSION_LINE_RE.search(data + f.read())
+        if m:
+            return m.group(1).decode("utf-8", errors="replace")
     except Exception:
         pass
     return None
@@ -697,37 +998,59 @@ def _read_version_from_file(script_path):
 def _fetch_remote_version():
     """Fetch the VERSION string from the latest master on GitHub. Returns None on failure."""
     try:
+        import urllib.request
         url = f"https://raw.githubusercontent.com/{GITHUB_REPO}/master/claude_status.py"
         req = urllib.request.Request(url, headers={"User-Agent": "claude-pulse-update-checker"})
         with urllib.request.urlopen(req, timeout=5) as resp:
-            for raw_line in resp:
-                line = raw_line.decode("utf-8", errors="replace")
-                if line.startswith("VERSION"):
-                    version = line.split('"')[1]
-                    return re.sub(r'[^a-zA-Z0-9.\-]', '', version) or None
+            # Only the first few KB are normally needed — read the rest only if absent
+            data = resp.read(_VERSION_PROBE_BYTES)
+            m = _VERSION_LINE_RE.search(data)
+            if not m:
+                m = _VERSION_LINE_RE.search(data + resp.read(1_000_000))
+        if m:
+            version = m.group(1).decode("utf-8", errors="replace")
+            return _VERSION_SANITIZE_RE.sub('', version) or None
     except Exception:
         pass
     return None
 
 
+def _flush_lines(out):
+    """Write buffered output lines in a single write and clear the buffer."""
+    if out:
+        utf8_print_lines(*out)
+        out.clear()
+
+
 def cmd_update():
     """Pull the latest version from GitHub."""
-    repo_dir = Path(__file__).resolve().parent
-    script_path = Path(__file__).resolve()
-    utf8_print(f"{BRIGHT_WHITE}claude-pulse update{RESET}\n")
-    utf8_print(f"  Current version: {BRIGHT_WHITE}v{VERSION}{RESET}")
+    out = []
+    try:
+        _run_update(out)
+    finally:
+        _flush_lines(out)
+
+
+def _run_update(out):
+    """Body of cmd_update — appends to `out`, flushing before each slow step."""
+    import subprocess
+    git_path = _git_path()
+    repo_dir = _script_path().parent
+    script_path = _script_path()
+    out.append(f"{BRIGHT_WHITE}claude-pulse update{RESET}\n")
+    out.append(f"  Current version: {BRIGHT_WHITE}v{VERSION}{RESET}")
 
     # Check if we're in a git repo
     git_dir = repo_dir / ".git"
     if not git_dir.exists():
-        utf8_print(f"  {RED}Not a git repository.{RESET}")
-        utf8_print(f"  Re-clone from: https://github.com/{GITHUB_REPO}")
+        out.append(f"  {RED}Not a git repository.{RESET}")
+        out.append(f"  Re-clone from: https://github.com/{GITHUB_REPO}")
         return
 
     # Verify the git remote points to the expected repository
     try:
         origin_result = subprocess.run(
-            [_GIT_PATH, "remote", "get-url", "origin"],
+            [git_path, "remote", "get-url", "origin"],
             capture_output=True, text=True, timeout=5,
             cwd=str(repo_dir),
         )
@@ -738,57 +1061,60 @@ def cmd_update():
             ":" + repo_lower, ":" + repo_lower + ".git",  # SSH git@github.com:user/repo
         ]
         if not any(origin_url.endswith(s) for s in expected_suffixes):
-            utf8_print(f"  {RED}Origin URL does not match expected repository.{RESET}")
-            utf8_print(f"  Expected: {GITHUB_REPO}")
-            utf8_print(f"  Got:      {_sanitize(origin_url)}")
+            out.append(f"  {RED}Origin URL does not match expected repository.{RESET}")
+            out.append(f"  Expected: {GITHUB_REPO}")
+            out.append(f"  Got:      {_sanitize(origin_url)}")
             return
     except Exception:
-        utf8_print(f"  {RED}Could not verify git remote.{RESET}")
+        out.append(f"  {RED}Could not verify git remote.{RESET}")
         return
 
     # Check current status
+    _flush_lines(out)
     local = get_local_commit()
     remote = get_remote_commit()
 
     if remote is None:
-        utf8_print(f"  {RED}Could not reach GitHub API to verify update integrity.{RESET}")
-        utf8_print(f"  Check your network connection and try again.")
+        out.append(f"  {RED}Could not reach GitHub API to verify update integrity.{RESET}")
+        out.append(f"  Check your network connection and try again.")
         return
 
     if local and local == remote:
-        utf8_print(f"  {GREEN}No update found — you're on the latest version (v{VERSION}).{RESET}")
+        out.append(f"  {GREEN}No update found — you're on the latest version (v{VERSION}).{RESET}")
         return
 
     # Fetch remote version to show what's available
     remote_version = _fetch_remote_version()
     if remote_version and remote_version != VERSION:
-        utf8_print(f"  {BRIGHT_YELLOW}Update found! v{VERSION} -> v{_sanitize(remote_version)}{RESET}")
+        out.append(f"  {BRIGHT_YELLOW}Update found! v{VERSION} -> v{_sanitize(remote_version)}{RESET}")
     else:
-        utf8_print(f"  {BRIGHT_YELLOW}Update found! New changes available{RESET}")
+        out.append(f"  {BRIGHT_YELLOW}Update found! New changes available{RESET}")
 
     # Ask for confirmation unless --confirm was passed
     if "--confirm" not in sys.argv:
         if sys.stdin.isatty():
+            _flush_lines(out)
             try:
                 answer = input(f"  Apply update? [y/N] ").strip().lower()
                 if answer not in ("y", "yes"):
-                    utf8_print(f"  {DIM}Update cancelled.{RESET}")
+                    out.append(f"  {DIM}Update cancelled.{RESET}")
                     return
             except (EOFError, KeyboardInterrupt):
-                utf8_print(f"\n  {DIM}Update cancelled.{RESET}")
+                out.append(f"\n  {DIM}Update cancelled.{RESET}")
                 return
         else:
-            utf8_print(f"  {DIM}Non-interactive mode. Run with --update --confirm to apply.{RESET}")
+            out.append(f"  {DIM}Non-interactive mode. Run with --update --confirm to apply.{RESET}")
             return
 
     # Capture local commit before pulling so we can show changelog after
     pre_pull_commit = local
 
     # Run git pull
-    utf8_print(f"  Pulling latest from GitHub...")
+    out.append(f"  Pulling latest from GitHub...")
+    _flush_lines(out)
     try:
         result = subprocess.run(
-            [_GIT_PATH, "pull", "origin", "master"],
+            [git_path, "pull", "origin", "master"],
             capture_output=True, text=True, timeout=30,
             cwd=str(repo_dir),
         )
@@ -796,86 +1122,119 @@ def cmd_update():
             # Verify post-pull HEAD matches the expected remote commit
             post_pull_head = get_local_commit()
             if post_pull_head and post_pull_head != remote:
-                utf8_print(f"  {RED}Integrity check failed: HEAD after pull ({post_pull_head[:8]}) does not match expected remote ({remote[:8]}).{RESET}")
+                out.append(f"  {RED}Integrity check failed: HEAD after pull ({post_pull_head[:8]}) does not match expected remote ({remote[:8]}).{RESET}")
                 if pre_pull_commit:
-                    utf8_print(f"  Rolling back to previous commit ({pre_pull_commit[:8]})...")
+                    out.append(f"  Rolling back to previous commit ({pre_pull_commit[:8]})...")
                     try:
                         subprocess.run(
-                            [_GIT_PATH, "reset", "--hard", pre_pull_commit],
+                            [git_path, "reset", "--hard", pre_pull_commit],
                             capture_output=True, text=True, timeout=10,
                             cwd=str(repo_dir),
                         )
                     except Exception:
                         pass
-                utf8_print(f"  {YELLOW}Update aborted. Please try again or re-clone the repository.{RESET}")
+                out.append(f"  {YELLOW}Update aborted. Please try again or re-clone the repository.{RESET}")
                 return
             # Read the new version from the updated file on disk
             new_version = _sanitize(_read_version_from_file(script_path) or "")
             if new_version and new_version != VERSION:
-                utf8_print(f"  {GREEN}Updated to v{new_version}!{RESET}")
+                out.append(f"  {GREEN}Updated to v{new_version}!{RESET}")
             else:
-                utf8_print(f"  {GREEN}Updated successfully!{RESET}")
+                out.append(f"  {GREEN}Updated successfully!{RESET}")
             if result.stdout.strip():
                 for ln in result.stdout.strip().split("\n"):
-                    utf8_print(f"  {DIM}{_sanitize(ln)}{RESET}")
+                    out.append(f"  {DIM}{_sanitize(ln)}{RESET}")
             # Show changelog — commits between old HEAD and new HEAD
             if pre_pull_commit:
                 try:
                     log_result = subprocess.run(
-                        [_GIT_PATH, "log", f"{pre_pull_commit}..HEAD", "--oneline", "--no-decorate", "-20"],
+                        [git_path, "log", f"{pre_pull_commit}..HEAD", "--oneline", "--no-decorate", "-20"],
                         capture_output=True, text=True, timeout=5,
                         cwd=str(repo_dir),
                     )
                     if log_result.returncode == 0 and log_result.stdout.strip():
-                        utf8_print(f"\n  {BOLD}Changelog:{RESET}")
+                        out.append(f"\n  {BOLD}Changelog:{RESET}")
                         for ln in log_result.stdout.strip().split("\n"):
-                            utf8_print(f"    {DIM}{_sanitize(ln)}{RESET}")
+                            out.append(f"    {DIM}{_sanitize(ln)}{RESET}")
                 except Exception:
                     pass
             # Clear all caches so the update indicator disappears immediately
-            state_dir = get_state_dir()
-            for cache_name in ("update_check.json", "cache.json"):
-                try:
-                    (state_dir / cache_name).unlink()
-                except OSError:
-                    pass
-            utf8_print(f"\n  Restart Claude Code to use v{new_version or 'latest'}.")
+            update_state(PULSE_UPDATE_KEY, None)
+            clear_cache()
+            out.append(f"\n  Restart Claude Code to use v{new_version or 'latest'}.")
         else:
-            utf8_print(f"  {RED}Update failed:{RESET}")
+            out.append(f"  {RED}Update failed:{RESET}")
             if result.stderr.strip():
                 for ln in result.stderr.strip().split("\n"):
-                    utf8_print(f"  {DIM}{_sanitize(ln)}{RESET}")
+                    out.append(f"  {DIM}{_sanitize(ln)}{RESET}")
     except subprocess.TimeoutExpired:
-        utf8_print(f"  {RED}Timed out. Check your network connection.{RESET}")
+        out.append(f"  {RED}Timed out. Check your network connection.{RESET}")
     except Exception as e:
-        utf8_print(f"  {RED}Update error: {type(e).__name__}{RESET}")
+        out.append(f"  {RED}Update error: {type(e).__name__}{RESET}")
 
 
-def read_cache(cache_path, ttl):
-    """Return the full cache dict if fresh, else None."""
-    try:
-        with open(cache_path, "r", encoding="utf-8") as f:
-            cached = json.load(f)
-        if time.time() - cached.get("timestamp", 0) < ttl:
-            return cached
-    except (FileNotFoundError, json.JSONDecodeError, KeyError):
-        pass
+def read_cache(key, ttl):
+    """Return the cached entry in the given state section if fresh, else None."""
+    if _state is None:
+        # The file's mtime bounds every section's timestamp — when even the
+        # newest write is older than the TTL, skip opening and parsing it
+        try:
+            if time.time() - os.stat(get_cache_path()).st_mtime >= ttl:
+                return None
+        except OSError:
+            return None
+    cached = load_state().get(key)
+    if isinstance(cached, dict) and time.time() - cached.get("timestamp", 0) < ttl:
+        return cached
     return None
 
 
-_USAGE_CACHE_KEYS = {"five_hour", "seven_day", "extra_usage"}
+_USAGE_CACHE_KEYS = ("five_hour", "seven_day", "extra_usage")
+LAST_GOOD_TTL = 86400  # serve the last good render for up to 24h while the API errors
+STALE_INDICATOR = f" {YELLOW}\u26a0{RESET}"
+# Past the TTL but within this many TTLs, show the previous render at once and
+# refresh the cache after the line is out (stale-while-revalidate)
+REVALIDATE_TTL_FACTOR = 4
 
-def write_cache(cache_path, line, usage=None, plan=None):
-    try:
-        data = {"timestamp": time.time(), "line": line}
-        if usage is not None:
-            data["usage"] = {k: v for k, v in usage.items() if k in _USAGE_CACHE_KEYS}
-        if plan is not None:
-            data["plan"] = plan
-        with _secure_open_write(cache_path) as f:
-            json.dump(data, f)
-    except OSError:
-        pass
+def write_cache(key, line, usage=None, plan=None, timestamp=None, stale=False):
+    # Store the line RESET-terminated so cache hits can emit it without rework
+    if not line.endswith(RESET):
+        line += RESET
+    data = {"timestamp": time.time() if timestamp is None else timestamp, "line": line}
+    if usage is not None:
+        sub = {}
+        for k in _USAGE_CACHE_KEYS:
+            v = usage.get(k)
+            if v is not None:
+                sub[k] = v
+        data["usage"] = sub
+    if plan is not None:
+        data["plan"] = plan
+    if stale:
+        data["stale"] = True
+    update_state(key, data)
+
+
+def clear_cache():
+    """Drop the cached status line so the next refresh re-renders from a fresh fetch."""
+    update_state(STATUS_KEY, None)
+
+
+def rerender_cache(config):
+    """Re-render the cached line after a presentation-only config change.
+
+    Usage data is unaffected by settings like currency or layout, so patch the
+    cached line in place (keeping its timestamp) instead of deleting the cache
+    and forcing a fresh API fetch on the next refresh.
+    """
+    cached = read_cache(STATUS_KEY, float("inf"))
+    if cached and "usage" in cached:
+        plan = cached.get("plan", "")
+        line = build_status_line(cached["usage"], plan, config)
+        write_cache(STATUS_KEY, line, cached["usage"], plan,
+                    timestamp=cached.get("timestamp"), stale=cached.get("stale", False))
+        return
+    clear_cache()
 
 
 # ---------------------------------------------------------------------------
@@ -887,19 +1246,25 @@ def write_cache(cache_path, line, usage=None, plan=None):
 _TOKEN_ALLOWED_DOMAINS = frozenset({"api.anthropic.com", "console.anthropic.com"})
 
 
-class _NoRedirectHandler(urllib.request.HTTPRedirectHandler):
-    """Block HTTP redirects to prevent tokens from leaking to third-party domains."""
+@functools.lru_cache(maxsize=1)
+def _safe_opener():
+    """Build (once) a urllib opener that refuses redirects off the allowed domains."""
+    import urllib.error
+    import urllib.request
+    from urllib.parse import urlparse
 
-    def redirect_request(self, req, fp, code, msg, headers, newurl):
-        target_domain = urlparse(newurl).hostname
-        if target_domain not in _TOKEN_ALLOWED_DOMAINS:
-            raise urllib.error.HTTPError(
-                newurl, code, f"Redirect to non-allowed domain blocked", headers, fp
-            )
-        return super().redirect_request(req, fp, code, msg, headers, newurl)
+    class _NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+        """Block HTTP redirects to prevent tokens from leaking to third-party domains."""
 
+        def redirect_request(self, req, fp, code, msg, headers, newurl):
+            target_domain = urlparse(newurl).hostname
+            if target_domain not in _TOKEN_ALLOWED_DOMAINS:
+                raise urllib.error.HTTPError(
+                    newurl, code, f"Redirect to non-allowed domain blocked", headers, fp
+                )
+            return super().redirect_request(req, fp, code, msg, headers, newurl)
 
-_safe_opener = urllib.request.build_opener(_NoRedirectHandler)
+    return urllib.request.build_opener(_NoRedirectHandler)
 
 
 def _authorized_request(url, token, headers=None, data=None, method=None, timeout=10):
@@ -910,22 +1275,45 @@ def _authorized_request(url, token, headers=None, data=None, method=None, timeou
     even if the code is modified or a URL is misconfigured.
     Redirects to non-allowed domains are blocked to prevent token exfiltration.
     """
+    from urllib.parse import urlparse
     domain = urlparse(url).hostname
     if domain not in _TOKEN_ALLOWED_DOMAINS:
         raise ValueError(f"Token request blocked: {_sanitize(domain)} is not an allowed domain")
     hdrs = dict(headers) if headers else {}
     if token:
         hdrs["Authorization"] = f"Bearer {token}"
+    import urllib.request
     req = urllib.request.Request(url, headers=hdrs, data=data, method=method)
-    return _safe_opener.open(req, timeout=timeout)
+    return _safe_opener().open(req, timeout=timeout)
+
+CREDENTIAL_CACHE_TTL = 60  # seconds an in-process credential read stays valid
+_cred_cache = {"mtime": None, "expires": 0, "result": (None, None)}
+
 
 def _read_credential_data():
-    """Read raw credential data from file or macOS Keychain. Returns (dict, source)."""
+    """Read raw credential data from file or macOS Keychain. Returns (dict, source).
+
+    Kept in memory only (never on disk) and reused while the credentials
+    file's mtime is unchanged, so a refresh-and-retry skips the Keychain fork.
+    """
+    creds_path = _claude_dir() / ".credentials.json"
+    try:
+        mtime = os.stat(creds_path).st_mtime_ns
+    except OSError:
+        mtime = None
+    now = time.time()
+    if now < _cred_cache["expires"] and _cred_cache["mtime"] == mtime:
+        return _cred_cache["result"]
+    result = _load_credential_data(creds_path)
+    _cred_cache.update(mtime=mtime, expires=now + CREDENTIAL_CACHE_TTL, result=result)
+    return result
+
+
+def _load_credential_data(creds_path):
+    """Uncached body of _read_credential_data."""
     # 1. File-based (~/.claude/.credentials.json)
-    creds_path = Path.home() / ".claude" / ".credentials.json"
     try:
-        with open(creds_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = _read_json(creds_path)
         if data.get("claudeAiOauth", {}).get("accessToken"):
             return data, "file"
     except (FileNotFoundError, json.JSONDecodeError, KeyError):
@@ -933,6 +1321,7 @@ def _read_credential_data():
 
     # 2. macOS Keychain fallback
     if sys.platform == "darwin":
+        import subprocess
         try:
             result = subprocess.run(
                 ["/usr/bin/security", "find-generic-password",
@@ -949,6 +1338,15 @@ def _read_credential_data():
     return None, None
 
 
+@functools.lru_cache(maxsize=16)
+def _plan_name(tier):
+    """Display name for a rate-limit tier; unknown tiers are derived from the id."""
+    plan = PLAN_NAMES.get(tier)
+    if plan is None:
+        plan = _sanitize(tier.replace("default_claude_", "").replace("_", " ").title())
+    return plan
+
+
 def _extract_credentials(data):
     """Extract token and plan from credential data dict."""
     if not data:
@@ -958,8 +1356,7 @@ def _extract_credentials(data):
     tier = oauth.get("rateLimitTier", "")
     if not token:
         return None, None
-    plan = PLAN_NAMES.get(tier, _sanitize(tier.replace("default_claude_", "").replace("_", " ").title()))
-    return token, plan
+    return token, _plan_name(tier)
 
 
 
@@ -1011,19 +1408,60 @@ def refresh_and_retry(plan):
     token_data = _refresh_oauth_token(refresh_token)
     if not token_data or "access_token" not in token_data:
         return None, plan
+    _cred_cache["expires"] = 0  # Claude Code may rewrite the store after a refresh
 
     # Return refreshed token in-memory only — don't write back to
     # credential store to avoid race conditions with Claude Code
     return token_data["access_token"], plan
 
 
+def _usage_validator(value):
+    """Return a response validator header fit to resend, or None."""
+    # Only plain printable ASCII — anything else could fail every later request
+    if isinstance(value, str) and 0 < len(value) <= 200 and value.isascii() and value.isprintable():
+        return value
+    return None
+
+
 def fetch_usage(token):
-    with _authorized_request(
-        "https://api.anthropic.com/api/oauth/usage",
-        token,
-        headers={"anthropic-beta": "oauth-2025-04-20", "Accept": "application/json"},
-    ) as resp:
-        return json.loads(resp.read(1_000_000))  # 1 MB max
+    import urllib.error
+    headers = {"anthropic-beta": "oauth-2025-04-20", "Accept": "application/json"}
+    # Revalidate against the last good fetch so an unchanged body comes back as 304
+    last_good = None
+    validators = load_state().get(USAGE_VALIDATORS_KEY)
+    if isinstance(validators, dict):
+        last_good = read_cache(LAST_GOOD_KEY, LAST_GOOD_TTL)
+        if last_good and "usage" in last_good:
+            etag = _usage_validator(validators.get("etag"))
+            last_modified = _usage_validator(validators.get("last_modified"))
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+    conditional = "If-None-Match" in headers or "If-Modified-Since" in headers
+    try:
+        with _authorized_request(
+            "https://api.anthropic.com/api/oauth/usage",
+            token,
+            headers=headers,
+        ) as resp:
+            usage = json.loads(resp.read(1_000_000))  # 1 MB max
+            etag = _usage_validator(resp.headers.get("ETag"))
+            last_modified = _usage_validator(resp.headers.get("Last-Modified"))
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and conditional:
+            return dict(last_good["usage"])
+        raise
+    if etag or last_modified:
+        update_state(USAGE_VALIDATORS_KEY, {"etag": etag, "last_modified": last_modified})
+    elif validators is not None:
+        update_state(USAGE_VALIDATORS_KEY, None)
+    # Sanitize reset timestamps once at ingest; renders and caches reuse them
+    for key in ("five_hour", "seven_day"):
+        window = usage.get(key) if isinstance(usage, dict) else None
+        if isinstance(window, dict) and window.get("resets_at") is not None:
+            window["resets_at"] = _sanitize(str(window["resets_at"]))
+    return usage
 
 
 # ---------------------------------------------------------------------------
@@ -1035,15 +1473,7 @@ def get_theme_colours(theme_name):
     return THEMES.get(theme_name, THEMES["default"])
 
 
-def bar_colour(pct, theme):
-    """Return ANSI colour based on usage percentage using theme colours."""
-    if pct >= 80:
-        return theme["high"]
-    if pct >= 50:
-        return theme["mid"]
-    return theme["low"]
-
-
+@functools.lru_cache(maxsize=64)
 def _fmt_tokens(n):
     """Format token count: 200000 -> '200k', 1000000 -> '1M'."""
     if n >= 1_000_000:
@@ -1060,23 +1490,36 @@ def make_bar(pct, theme=None, plain=False, width=None, bar_style=None):
     if width is None:
         width = BAR_SIZES[DEFAULT_BAR_SIZE]
     fill_char, empty_char = BAR_STYLES.get(bar_style or DEFAULT_BAR_STYLE, BAR_STYLES[DEFAULT_BAR_STYLE])
+    colours = None if plain else (theme["low"], theme["mid"], theme["high"])
+    return _make_bar_fast(pct, colours, fill_char, empty_char, width)
+
+
+def _make_bar_fast(pct, colours, fill_char, empty_char, width):
+    """make_bar with everything pre-resolved: colours is (low, mid, high) or None for plain."""
     pct = pct or 0
-    filled = round(pct / 100 * width)
-    filled = max(0, min(width, filled))
-    if plain:
-        # Keep empty chars DIM so rainbow_colorize (color_all=False) preserves
-        # the distinction: filled chars get rainbow, empty chars stay dim
-        return f"{fill_char * filled}{DIM}{empty_char * (width - filled)}{RESET}"
-    colour = bar_colour(pct, theme)
+    filled = max(0, min(width, round(pct / 100 * width)))
+    # Keep empty chars DIM in plain mode so rainbow_colorize (color_all=False)
+    # preserves the distinction: filled chars get rainbow, empty chars stay dim
+    if colours is None:
+        colour = ""
+    else:
+        colour = colours[2] if pct >= 80 else colours[1] if pct >= 50 else colours[0]
+    return _bar_string(colour, fill_char, empty_char, filled, width)
+
+
+@functools.lru_cache(maxsize=1024)
+def _bar_string(colour, fill_char, empty_char, filled, width):
+    """Assemble a bar's ANSI string; cached since the same bars recur constantly."""
     return f"{colour}{fill_char * filled}{DIM}{empty_char * (width - filled)}{RESET}"
 
 
-def format_reset_time(resets_at_str):
+def format_reset_time(resets_at_str, now=None):
     if not resets_at_str:
         return None
     try:
         resets_at = datetime.fromisoformat(resets_at_str)
-        now = datetime.now(timezone.utc)
+        if now is None:
+            now = datetime.now(timezone.utc)
         total_seconds = int((resets_at - now).total_seconds())
         if total_seconds <= 0:
             return "now"
@@ -1090,6 +1533,12 @@ def format_reset_time(resets_at_str):
 
 
 WEEKLY_TIMER_FORMATS = ("auto", "countdown", "date", "full")
+WEEKLY_TIMER_DESCRIPTIONS = {
+    "auto": "date when >24h, countdown when <24h",
+    "countdown": "always show countdown (2d 5h / 14h 22m)",
+    "date": "always show date (Sat 5pm)",
+    "full": "both date and countdown (Sat 5pm \u00b7 2d 5h)",
+}
 DEFAULT_WEEKLY_TIMER_FORMAT = "auto"
 DEFAULT_WEEKLY_TIMER_PREFIX = "R:"
 
@@ -1122,7 +1571,7 @@ def _weekly_date(resets_at):
     return f"{local_dt.strftime('%a')} {time_str}"
 
 
-def format_weekly_reset(resets_at_str, fmt="auto"):
+def format_weekly_reset(resets_at_str, fmt="auto", now=None):
     """Format weekly reset time.
 
     Formats:
@@ -1134,9 +1583,9 @@ def format_weekly_reset(resets_at_str, fmt="auto"):
     if not resets_at_str:
         return None
     try:
-        safe = _sanitize(str(resets_at_str))
-        resets_at = datetime.fromisoformat(safe)
-        now = datetime.now(timezone.utc)
+        resets_at = datetime.fromisoformat(resets_at_str)  # sanitized in fetch_usage
+        if now is None:
+            now = datetime.now(timezone.utc)
         total_seconds = int((resets_at - now).total_seconds())
         if total_seconds <= 0:
             return "now"
@@ -1156,57 +1605,94 @@ def format_weekly_reset(resets_at_str, fmt="auto"):
 
 def _get_history_path():
     """Return path to usage history file."""
-    return get_state_dir() / "history.json"
+    return get_state_dir() / "history.bin"
 
 
 def _read_history():
-    """Read usage history samples."""
+    """Read usage history as a list of (t, session_pct, weekly_pct) tuples."""
     try:
-        with open(_get_history_path(), "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
+        return _read_history_records()
+    except FileNotFoundError:
+        return _read_legacy_history()
+
+
+def _read_history_records():
+    """Read history.bin; raises FileNotFoundError if it hasn't been written yet."""
+    try:
+        with open(_get_history_path(), "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        raise
+    except OSError:
         return []
+    # Ignore a trailing partial record rather than discarding the whole file
+    usable = len(data) - len(data) % HISTORY_RECORD.size
+    return list(HISTORY_RECORD.iter_unpack(memoryview(data)[:usable]))
 
 
-def _append_history(usage):
+def _read_legacy_history():
+    """Read samples from the pre-binary history.json, if one is left over."""
+    try:
+        samples = _read_json(get_state_dir() / "history.json")
+        return [(s.get("t", 0), s.get("s", 0), s.get("w", 0)) for s in samples]
+    except (FileNotFoundError, ValueError, AttributeError, TypeError):
+        return []
+
+
+def _append_history(usage, now=None):
     """Append a usage sample to history and prune old entries."""
     five = usage.get("five_hour", {})
     seven = usage.get("seven_day", {})
     session_pct = five.get("utilization") or 0
     weekly_pct = seven.get("utilization") or 0
 
-    samples = _read_history()
-    now = time.time()
-    samples.append({"t": now, "s": session_pct, "w": weekly_pct})
+    try:
+        samples = _read_history_records()
+        migrating = False
+    except FileNotFoundError:
+        samples = _read_legacy_history()
+        migrating = bool(samples)  # history.json had samples to carry over
+    if now is None:
+        now = time.time()
+    samples.append((now, session_pct, weekly_pct))
 
     # Prune entries older than 24 hours and cap entry count
     cutoff = now - HISTORY_MAX_AGE
-    samples = [s for s in samples if s.get("t", 0) > cutoff]
-    samples = samples[-2000:]  # prevent unbounded growth
+    samples = [s for s in samples if s[0] > cutoff]
+    samples = samples[-HISTORY_MAX_SAMPLES:]  # prevent unbounded growth
 
+    buf = bytearray(HISTORY_RECORD.size * len(samples))
+    for i, sample in enumerate(samples):
+        HISTORY_RECORD.pack_into(buf, i * HISTORY_RECORD.size, *sample)
     try:
-        with _secure_open_write(_get_history_path()) as f:
-            json.dump(samples, f)
+        with _secure_open_write(_get_history_path(), binary=True) as f:
+            f.write(buf)
     except OSError:
-        pass
+        return
+    if migrating:
+        try:
+            (get_state_dir() / "history.json").unlink()  # migrated to history.bin
+        except OSError:
+            pass
 
 
-def _render_sparkline(samples, key="s", width=8):
+def _render_sparkline(samples, field=1, width=8):
     """Render a sparkline from usage samples."""
     if not samples:
         return ""
     # Take the last `width` samples
-    recent = samples[-width:]
-    chars = []
-    for s in recent:
-        val = s.get(key, 0)
-        # Map 0-100 to index 0-6 (avoid █ at index 7 — it's in ALL_BAR_CHARS)
-        idx = min(6, max(0, int(val / 100 * 6.99)))
-        chars.append(SPARKLINE_CHARS[idx])
-    return "".join(chars)
+    return "".join(_SPARK_TABLE[max(0, min(100, int(s[field])))] for s in samples[-width:])
+
+
+def _recent_samples(samples, cutoff):
+    """Return the tail of time-ordered samples newer than cutoff, scanning from the end."""
+    i = len(samples)
+    while i > 0 and samples[i - 1][0] > cutoff:
+        i -= 1
+    return samples[i:]
 
 
-def _estimate_runway(samples, current_pct):
+def _estimate_runway(samples, current_pct, now=None):
     """Estimate time until 100% usage via linear regression over recent samples.
 
     Returns a string like '~2h 15m' or '~45m', or None if insufficient data.
@@ -1214,20 +1700,26 @@ def _estimate_runway(samples, current_pct):
     if len(samples) < 2 or current_pct >= 100:
         return None
 
-    now = time.time()
+    if now is None:
+        now = time.time()
     # Use samples from the last 10 minutes
     cutoff = now - 600
-    recent = [s for s in samples if s.get("t", 0) > cutoff]
+    recent = _recent_samples(samples, cutoff)
 
     if len(recent) < 2:
         return None
 
-    # Simple linear regression: pct vs time
+    # Simple linear regression: pct vs time, in one pass. Times are taken
+    # relative to the first sample so the sums stay small and well conditioned.
     n = len(recent)
-    sum_t = sum(s["t"] for s in recent)
-    sum_s = sum(s.get("s", 0) for s in recent)
-    sum_ts = sum(s["t"] * s.get("s", 0) for s in recent)
-    sum_tt = sum(s["t"] ** 2 for s in recent)
+    t0 = recent[0][0]
+    sum_t = sum_s = sum_ts = sum_tt = 0.0
+    for t, v, _ in recent:
+        t -= t0
+        sum_t += t
+        sum_s += v
+        sum_ts += t * v
+        sum_tt += t * t
 
     denom = n * sum_tt - sum_t ** 2
     if abs(denom) < 1e-10:
@@ -1252,18 +1744,19 @@ def _estimate_runway(samples, current_pct):
     return f"~{minutes}m"
 
 
-def _compute_velocity(samples):
+def _compute_velocity(samples, now=None):
     """Compute usage velocity in pct/min from recent history samples."""
     if len(samples) < 2:
         return None
-    now = time.time()
-    recent = [s for s in samples if s.get("t", 0) > now - 300]  # last 5 min
+    if now is None:
+        now = time.time()
+    recent = _recent_samples(samples, now - 300)  # last 5 min
     if len(recent) < 2:
         return None
-    dt = recent[-1]["t"] - recent[0]["t"]
+    dt = recent[-1][0] - recent[0][0]
     if dt < 10:  # less than 10 seconds of data
         return None
-    dp = recent[-1].get("s", 0) - recent[0].get("s", 0)
+    dp = recent[-1][1] - recent[0][1]
     return (dp / dt) * 60  # pct per minute
 
 
@@ -1303,6 +1796,7 @@ STREAK_MILESTONES = {
     500: "500!",
     1000: "Legend!",
 }
+DAILY_DATES_MAX = 400  # recent days kept for streak rescans (covers a year-long streak)
 
 
 def _today_local():
@@ -1318,8 +1812,7 @@ def _get_stats_path():
 def _load_stats():
     """Load stats from disk with defaults."""
     try:
-        with open(_get_stats_path(), "r", encoding="utf-8") as f:
-            return json.load(f)
+        return _read_json(_get_stats_path())
     except (FileNotFoundError, json.JSONDecodeError):
         return {
             "first_seen": _today_local(),
@@ -1335,9 +1828,10 @@ def _save_stats(stats):
     """Save stats to disk."""
     try:
         with _secure_open_write(_get_stats_path()) as f:
-            json.dump(stats, f, indent=2)
+            f.write(json.dumps(stats, indent=2))
     except OSError:
-        pass
+        return
+    update_state(STREAK_KEY, {"timestamp": time.time(), "current_streak": stats.get("current_streak", 0)})
 
 
 def _calculate_streak(daily_dates, today):
@@ -1349,8 +1843,12 @@ def _calculate_streak(daily_dates, today):
     if not daily_dates:
         return (0, 0)
 
-    # Deduplicate and sort
-    unique = sorted(set(daily_dates))
+    # _update_stats keeps the list sorted and unique (ISO dates order as
+    # strings); only an externally edited list needs deduplicating and sorting
+    if all(a < b for a, b in zip(daily_dates, daily_dates[1:])):
+        unique = daily_dates
+    else:
+        unique = sorted(set(daily_dates))
     dates = []
     for d in unique:
         try:
@@ -1385,7 +1883,7 @@ def _calculate_streak(daily_dates, today):
         if d_ord == check_ord:
             current_streak += 1
             check_ord -= 1
-        elif d_ord == check_ord + 1 and current_streak == 0:
+        elif d_ord == check_ord - 1 and current_streak == 0:
             # Today not logged yet, start from yesterday
             current_streak = 1
             check_ord = d_ord - 1
@@ -1395,6 +1893,28 @@ def _calculate_streak(daily_dates, today):
     return (current_streak, longest)
 
 
+def _days_since(date_str, today):
+    """Return whole days from date_str to today (both YYYY-MM-DD), or None if unparseable."""
+    try:
+        return (datetime.strptime(today, "%Y-%m-%d") - datetime.strptime(date_str, "%Y-%m-%d")).days
+    except (TypeError, ValueError):
+        return None
+
+
+def _stored_streak_gap(stats, today):
+    """Days since the streak counters were last updated, or None if they can't be trusted.
+
+    The counters are trusted only while last_date is still the newest entry in
+    daily_dates — an externally edited list falls back to a full rescan.
+    """
+    dates = stats.get("daily_dates") or []
+    last = stats.get("last_date")
+    if not dates or dates[-1] != last or "current_streak" not in stats:
+        return None
+    gap = _days_since(last, today)
+    return gap if gap is not None and gap >= 0 else None
+
+
 def _check_milestone(total):
     """Check if total sessions hit a milestone. Returns message or None."""
     return STREAK_MILESTONES.get(total)
@@ -1411,14 +1931,25 @@ def _update_stats():
     if not stats.get("first_seen"):
         stats["first_seen"] = today
 
+    # Extend the stored streak incrementally; rescan only if it can't be trusted
+    gap = _stored_streak_gap(stats, today)
+
     daily_dates = stats.get("daily_dates", [])
-    if today not in daily_dates:
+    if "days_active" not in stats:
+        stats["days_active"] = len(set(daily_dates))
+    if not daily_dates or daily_dates[-1] != today:  # sorted, unique: only the tail can match
         daily_dates.append(today)
-    stats["daily_dates"] = daily_dates
+        stats["days_active"] += 1
+    # Streaks are extended incrementally, so only a recent window is needed
+    stats["daily_dates"] = daily_dates[-DAILY_DATES_MAX:]
 
     stats["total_sessions"] = stats.get("total_sessions", 0) + 1
 
-    current, longest = _calculate_streak(daily_dates, today)
+    if gap is not None:
+        current = stats["current_streak"] + 1 if gap == 1 else 1
+        longest = current
+    else:
+        current, longest = _calculate_streak(stats["daily_dates"], today)
     stats["current_streak"] = current
     stats["longest_streak"] = max(stats.get("longest_streak", 0), longest)
     stats["last_date"] = today
@@ -1429,12 +1960,22 @@ def _update_stats():
     return (stats, milestone)
 
 
-def _get_streak_display(config, stats):
+def _current_streak():
+    """Return the stored current streak without reading stats.json on every render."""
+    mirrored = load_state().get(STREAK_KEY)
+    if isinstance(mirrored, dict) and "current_streak" in mirrored:
+        return mirrored["current_streak"]
+    # Stats written before the mirror existed — seed it once
+    streak = _load_stats().get("current_streak", 0)
+    update_state(STREAK_KEY, {"timestamp": time.time(), "current_streak": streak})
+    return streak
+
+
+def _get_streak_display(config, streak):
     """Return formatted streak string like '7d streak' or ''."""
     show = config.get("show", DEFAULT_SHOW)
     if not show.get("streak", True):
         return ""
-    streak = stats.get("current_streak", 0)
     if streak < 2:
         return ""
     style = config.get("streak_style", "text")
@@ -1447,12 +1988,21 @@ def cmd_stats():
     """Show full session stats summary."""
     stats = _load_stats()
     today = _today_local()
-    current, longest = _calculate_streak(stats.get("daily_dates", []), today)
+    gap = _stored_streak_gap(stats, today)
+    if gap is not None:
+        # A streak survives until the end of the day after it was last extended
+        current = stats["current_streak"] if gap <= 1 else 0
+        longest = stats.get("longest_streak", 0)
+    else:
+        current, longest = _calculate_streak(stats.get("daily_dates", []), today)
 
     utf8_print(f"\n{BOLD}claude-pulse stats{RESET}\n")
     utf8_print(f"  First seen:     {_sanitize(str(stats.get('first_seen', 'unknown')))}")
     utf8_print(f"  Total sessions: {stats.get('total_sessions', 0)}")
-    utf8_print(f"  Days active:    {len(set(stats.get('daily_dates', [])))}")
+    days_active = stats.get("days_active")
+    if days_active is None:
+        days_active = len(set(stats.get("daily_dates", [])))
+    utf8_print(f"  Days active:    {days_active}")
     utf8_print(f"  Current streak: {current}d")
     utf8_print(f"  Longest streak: {max(stats.get('longest_streak', 0), longest)}d")
 
@@ -1462,6 +2012,41 @@ def cmd_stats():
     utf8_print("")
 
 
+STDIN_LIMIT = 65536
+STDIN_TIMEOUT = 1.0  # seconds to wait for Claude Code to finish writing stdin
+
+
+def _read_stdin():
+    """Read the stdin JSON as raw bytes, bounded in size and in time.
+
+    Stops at EOF, at STDIN_LIMIT bytes, or once STDIN_TIMEOUT passes without
+    EOF, so a writer that never closes the pipe can't stall the status line.
+    """
+    if sys.stdin is None or sys.stdin.isatty():
+        return b""
+    try:
+        if sys.platform == "win32":
+            # select() only works on sockets on Windows — plain bounded read
+            return sys.stdin.buffer.read(STDIN_LIMIT)
+        import select
+        fd = sys.stdin.fileno()
+        deadline = time.monotonic() + STDIN_TIMEOUT
+        chunks = []
+        size = 0
+        while size < STDIN_LIMIT:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                break
+            chunk = os.read(fd, STDIN_LIMIT - size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        return b"".join(chunks)
+    except Exception:
+        return b""
+
+
 def _parse_stdin_context(raw_stdin):
     """Parse Claude Code's stdin JSON for session context.
 
@@ -1472,14 +2057,17 @@ def _parse_stdin_context(raw_stdin):
         return {}
     try:
         data = json.loads(raw_stdin)
-    except (json.JSONDecodeError, TypeError):
+    except (ValueError, TypeError):  # JSONDecodeError, or undecodable bytes
         return {}
+    if not isinstance(data, dict):
+        return {}
+    root = data.get("data", data)
 
     result = {}
 
     # Model name
     try:
-        model = data.get("data", data).get("model", {})
+        model = root.get("model", {})
         display_name = _sanitize(model.get("display_name", ""))
         if display_name:
             # Strip "Claude " prefix: "Claude Opus 4.6" → "Opus 4.6"
@@ -1494,7 +2082,7 @@ def _parse_stdin_context(raw_stdin):
 
     # Context window usage
     try:
-        ctx = data.get("data", data).get("context_window", {})
+        ctx = root.get("context_window", {})
         used_pct = ctx.get("used_percentage")
         if used_pct is not None:
             result["context_pct"] = float(used_pct)
@@ -1510,7 +2098,7 @@ def _parse_stdin_context(raw_stdin):
 
     # Cost
     try:
-        cost = data.get("data", data).get("cost", {})
+        cost = root.get("cost", {})
         total = cost.get("total_cost_usd")
         if total is not None:
             result["cost_usd"] = float(total)
@@ -1520,12 +2108,64 @@ def _parse_stdin_context(raw_stdin):
     return result
 
 
+# Persisted stdin context is an append-only log of JSON lines; the newest line wins
+STDIN_CTX_KEYS = frozenset({"model_name", "context_pct", "context_used", "context_limit", "cost_usd"})
+STDIN_CTX_COMPACT_BYTES = 4096  # rewrite the log as a single record past this size
+_STDIN_CTX_TAIL_BYTES = 1024    # records are ~150 bytes, so the newest is always in this tail
+
+
+def _get_stdin_ctx_path():
+    """Return path to the persisted stdin context log."""
+    return get_state_dir() / "stdin_ctx.ndjson"
+
+
+def _read_stdin_ctx():
+    """Return (newest persisted context, log size in bytes)."""
+    try:
+        with open(_get_stdin_ctx_path(), "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - _STDIN_CTX_TAIL_BYTES))
+            tail = f.read()
+    except OSError:
+        return {}, 0
+    # A torn or partially-read record never parses as an object — fall back a line
+    for record in reversed(tail.split(b"\n")):
+        try:
+            data = json.loads(record)
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            ctx = {}
+            for k in STDIN_CTX_KEYS & data.keys():
+                v = data[k]
+                # Only the model name is a string; numbers pass straight through
+                ctx[k] = _sanitize(v) if type(v) is str else v
+            return ctx, size
+    return {}, size
+
+
+def _write_stdin_ctx(ctx, size):
+    """Append a context record to the log, compacting it once it grows large."""
+    record = json.dumps(ctx) + "\n"
+    filepath = _get_stdin_ctx_path()
+    try:
+        if size + len(record) > STDIN_CTX_COMPACT_BYTES:
+            _atomic_write(filepath, record)
+            return
+        with _secure_open_write(filepath, append=True) as f:
+            f.write(record.encode("utf-8"))
+        if not size:
+            (get_state_dir() / "stdin_ctx.json").unlink(missing_ok=True)  # pre-log format
+    except OSError:
+        pass
+
+
 def _get_heatmap_path():
     """Return path to heatmap data file."""
     return get_state_dir() / "heatmap.json"
 
 
-def _update_heatmap(usage):
+def _update_heatmap(usage, now=None):
     """Update the activity heatmap with current usage data."""
     five = usage.get("five_hour", {})
     seven = usage.get("seven_day", {})
@@ -1534,15 +2174,15 @@ def _update_heatmap(usage):
 
     # Load existing heatmap
     try:
-        with open(_get_heatmap_path(), "r", encoding="utf-8") as f:
-            heatmap = json.load(f)
+        heatmap = _read_json(_get_heatmap_path())
     except (FileNotFoundError, json.JSONDecodeError):
         heatmap = {}
 
     hours = heatmap.get("hours", {})
 
     # Current hour key in UTC: YYYY-MM-DDTHH
-    now = datetime.now(timezone.utc)
+    if now is None:
+        now = datetime.now(timezone.utc)
     hour_key = now.strftime("%Y-%m-%dT%H")
 
     # Update entry for current hour — track peak session_pct
@@ -1555,13 +2195,14 @@ def _update_heatmap(usage):
     # Prune entries older than 28 days (672 hours)
     cutoff = now - timedelta(days=28)
     cutoff_key = cutoff.strftime("%Y-%m-%dT%H")
-    hours = {k: v for k, v in hours.items() if k >= cutoff_key}
+    for k in [k for k in hours if k < cutoff_key]:
+        del hours[k]
 
     heatmap["hours"] = hours
 
     try:
         with _secure_open_write(_get_heatmap_path()) as f:
-            json.dump(heatmap, f)
+            f.write(json.dumps(heatmap))
     except OSError:
         pass
 
@@ -1592,12 +2233,13 @@ def _render_heatmap(config=None):
     theme = get_theme_colours(theme_name)
 
     intensity_chars = ["\u00b7", "\u2591", "\u2592", "\u2593", "\u2588"]  # ·, ░, ▒, ▓, █
-    intensity_colors = ["", theme["low"], theme["low"], theme["mid"], theme["high"]]
+    intensity_colors = [DIM, theme["low"], theme["low"], theme["mid"], theme["high"]]
+    # Only five distinct cells exist — render each once and index by level
+    cells = [f"{color}{ch}{RESET}  " for color, ch in zip(intensity_colors, intensity_chars)]
 
     # Load heatmap data
     try:
-        with open(_get_heatmap_path(), "r", encoding="utf-8") as f:
-            heatmap = json.load(f)
+        heatmap = _read_json(_get_heatmap_path())
     except (FileNotFoundError, json.JSONDecodeError):
         heatmap = {}
 
@@ -1611,9 +2253,9 @@ def _render_heatmap(config=None):
     for day_offset in range(7):
         day = now - timedelta(days=(6 - day_offset))
         weekday = day.weekday()  # Mon=0, Sun=6
+        day_prefix = day.strftime("%Y-%m-%dT")
         for hour in range(24):
-            key = day.strftime("%Y-%m-%dT") + f"{hour:02d}"
-            entry = hours_data.get(key, {})
+            entry = hours_data.get(f"{day_prefix}{hour:02d}", {})
             pct = entry.get("session_pct", 0)
             grid[weekday][hour] = _heatmap_intensity(pct)
 
@@ -1621,25 +2263,12 @@ def _render_heatmap(config=None):
     lines = []
 
     # Hour labels header
-    header = "     "
-    for h in range(24):
-        if h % 6 == 0:
-            header += f"{h:<3}"
-        else:
-            header += "   "
+    header = "     " + "".join(f"{h:<3}" if h % 6 == 0 else "   " for h in range(24))
     lines.append(header.rstrip())
 
     # Grid rows
     for weekday in range(7):
-        row = f" {day_labels[weekday]} "
-        for hour in range(24):
-            level = grid[weekday][hour]
-            ch = intensity_chars[level]
-            color = intensity_colors[level]
-            if color:
-                row += f"{color}{ch}{RESET}  "
-            else:
-                row += f"{DIM}{ch}{RESET}  "
+        row = f" {day_labels[weekday]} " + "".join(cells[level] for level in grid[weekday])
         lines.append(row.rstrip())
 
     return "\n".join(lines)
@@ -1683,11 +2312,16 @@ def build_status_line(usage, plan, config=None, stdin_ctx=None):
     bar_size = config.get("bar_size", DEFAULT_BAR_SIZE)
     bw = BAR_SIZES.get(bar_size, BAR_SIZES[DEFAULT_BAR_SIZE])
     bstyle = config.get("bar_style", DEFAULT_BAR_STYLE)
+    # Resolve bar style and colours once for every bar in the line
+    fill_ch, empty_ch = BAR_STYLES.get(bstyle or DEFAULT_BAR_STYLE, BAR_STYLES[DEFAULT_BAR_STYLE])
+    bar_colours = None if bar_plain else (theme["low"], theme["mid"], theme["high"])
     layout = config.get("layout", DEFAULT_LAYOUT)
+    templates = LAYOUT_TEMPLATES.get(layout, LAYOUT_TEMPLATES[DEFAULT_LAYOUT])
 
     # Terminal width clamping — prevent bars from causing line wrapping
     # Estimate: each section ≈ bw + 15 chars of text, up to 4 sections + separators
     try:
+        import shutil
         term_width = shutil.get_terminal_size((120, 24)).columns
         # Count how many bar sections we'll render
         num_bars = sum(1 for k in ("session", "weekly") if show.get(k, True))
@@ -1704,6 +2338,10 @@ def build_status_line(usage, plan, config=None, stdin_ctx=None):
     except Exception:
         pass  # if terminal size detection fails, use configured size
 
+    # One clock read shared by every timer, runway, and velocity field
+    now_utc = datetime.now(timezone.utc)
+    now_ts = now_utc.timestamp()
+
     parts = []
 
     # Current Session (5-hour block)
@@ -1711,74 +2349,59 @@ def build_status_line(usage, plan, config=None, stdin_ctx=None):
         five = usage.get("five_hour")
         if five:
             pct = five.get("utilization") or 0
-            bar = make_bar(pct, theme, plain=bar_plain, width=bw, bar_style=bstyle)
-            reset = format_reset_time(five.get("resets_at")) if show.get("timer", True) else None
+            bar = _make_bar_fast(pct, bar_colours, fill_ch, empty_ch, bw)
+            reset = format_reset_time(five.get("resets_at"), now_utc) if show.get("timer", True) else None
             reset_str = f" {reset}" if reset else ""
-            if layout == "compact":
-                parts.append(f"S {bar} {pct:.0f}%{reset_str}")
-            elif layout == "minimal":
-                parts.append(f"{bar} {pct:.0f}%{reset_str}")
-            elif layout == "percent-first":
-                parts.append(f"{pct:.0f}% {bar}{reset_str}")
-            else:  # standard
-                # Load history once for sparkline, runway, and smart messages
-                history = _read_history() if show.get("sparkline", True) or show.get("runway", True) or show.get("status_message", True) else []
+            label = "Session"
+            if templates is LAYOUT_TEMPLATES["standard"]:
+                show_message = show.get("status_message", True)
+                show_spark = show.get("sparkline", True)
+                show_runway = show.get("runway", True)
+                # Load history once for sparkline, runway, and smart messages —
+                # and not at all when none of them is shown
+                history = _read_history() if show_message or show_spark or show_runway else []
                 # Smart status message replaces "Session" label
-                label = "Session"
-                if show.get("status_message", True):
-                    velocity = _compute_velocity(history)
+                if show_message:
+                    velocity = _compute_velocity(history, now_ts) if history else None
                     msg, _ = _get_status_message(pct, velocity)
                     label = msg
                 # Sparkline
                 spark_str = ""
-                if show.get("sparkline", True):
+                if show_spark and history:
                     spark = _render_sparkline(history)
                     if spark:
                         spark_str = f" {spark}"
                 # Runway
                 runway_str = ""
-                if show.get("runway", True):
-                    runway = _estimate_runway(history, pct)
+                if show_runway and history:
+                    runway = _estimate_runway(history, pct, now_ts)
                     if runway:
                         runway_str = f" {runway}"
                 # Separate timer from runway/sparkline with · when both present
                 if reset_str and (runway_str or spark_str):
                     reset_str = f" \u00b7{reset}"
-                parts.append(f"{label} {bar} {pct:.0f}%{spark_str}{runway_str}{reset_str}")
+                reset_str = f"{spark_str}{runway_str}{reset_str}"
+            parts.append(templates["session"].format(label=label, bar=bar, pct=pct, reset=reset_str))
         else:
-            bar = make_bar(0, theme, plain=bar_plain, width=bw, bar_style=bstyle)
-            if layout == "compact":
-                parts.append(f"S {bar} 0%")
-            elif layout == "minimal":
-                parts.append(f"{bar} 0%")
-            elif layout == "percent-first":
-                parts.append(f"0% {bar}")
-            else:
-                parts.append(f"Session {bar} 0%")
+            bar = _make_bar_fast(0, bar_colours, fill_ch, empty_ch, bw)
+            parts.append(templates["session_zero"].format(bar=bar))
 
     # Weekly Limit (7-day all models)
     if show.get("weekly", True):
         seven = usage.get("seven_day")
         if seven:
             pct = seven.get("utilization") or 0
-            bar = make_bar(pct, theme, plain=bar_plain, width=bw, bar_style=bstyle)
+            bar = _make_bar_fast(pct, bar_colours, fill_ch, empty_ch, bw)
             weekly_reset_str = ""
             if show.get("weekly_timer", True):
                 wt_fmt = config.get("weekly_timer_format", DEFAULT_WEEKLY_TIMER_FORMAT)
                 if wt_fmt not in WEEKLY_TIMER_FORMATS:
                     wt_fmt = DEFAULT_WEEKLY_TIMER_FORMAT
                 wt_prefix = _sanitize(str(config.get("weekly_timer_prefix", DEFAULT_WEEKLY_TIMER_PREFIX)))[:10]
-                wr = format_weekly_reset(seven.get("resets_at"), fmt=wt_fmt)
+                wr = format_weekly_reset(seven.get("resets_at"), fmt=wt_fmt, now=now_utc)
                 if wr:
                     weekly_reset_str = f" {wt_prefix}{wr}"
-            if layout == "compact":
-                parts.append(f"W {bar} {pct:.0f}%{weekly_reset_str}")
-            elif layout == "minimal":
-                parts.append(f"{bar} {pct:.0f}%{weekly_reset_str}")
-            elif layout == "percent-first":
-                parts.append(f"{pct:.0f}% {bar}{weekly_reset_str}")
-            else:
-                parts.append(f"Weekly {bar} {pct:.0f}%{weekly_reset_str}")
+            parts.append(templates["weekly"].format(bar=bar, pct=pct, reset=weekly_reset_str))
 
     # Extra usage (bonus/gifted credits)
     # Auto-shows when credits are gifted, unless user explicitly hid it
@@ -1792,38 +2415,22 @@ def build_status_line(usage, plan, config=None, stdin_ctx=None):
             pct = min(extra.get("utilization") or 0, 100)
             used = (extra.get("used_credits") or 0) / 100  # API returns pence/cents
             limit = (extra.get("monthly_limit") or 0) / 100
+            used_str = f"{currency}{used:.2f}"
             extra_display = config.get("extra_display", "auto")
-            if extra_display == "auto":
-                extra_display = "amount" if limit == 0 else "full"
-            if extra_display == "amount":
-                if layout == "compact":
-                    parts.append(f"E {currency}{used:.2f}")
-                elif layout == "minimal":
-                    parts.append(f"{currency}{used:.2f}")
-                else:
-                    parts.append(f"Extra {currency}{used:.2f}")
+            if extra_display == "amount" or (extra_display == "auto" and limit == 0):
+                parts.append(templates["extra_amount"].format(used=used_str))
             else:
-                bar = make_bar(pct, theme, plain=bar_plain, width=bw, bar_style=bstyle)
-                if layout == "compact":
-                    parts.append(f"E {bar} {currency}{used:.2f}/{currency}{limit:.2f}")
-                elif layout == "minimal":
-                    parts.append(f"{bar} {currency}{used:.2f}")
-                elif layout == "percent-first":
-                    parts.append(f"{currency}{used:.2f} {bar}")
-                else:
-                    parts.append(f"Extra {bar} {currency}{used:.2f}/{currency}{limit:.2f}")
+                bar = _make_bar_fast(pct, bar_colours, fill_ch, empty_ch, bw)
+                parts.append(templates["extra_bar"].format(bar=bar, used=used_str, limit=f"{currency}{limit:.2f}"))
         elif extra_enabled_by_user:
-            bar = make_bar(0, theme, plain=bar_plain, bar_style=bstyle)
-            if layout == "minimal":
-                parts.append(f"{bar} none")
-            else:
-                parts.append(f"Extra {bar} none")
+            bar = _make_bar_fast(0, bar_colours, fill_ch, empty_ch, BAR_SIZES[DEFAULT_BAR_SIZE])
+            parts.append(templates["extra_none"].format(bar=bar))
 
     # Context window usage from stdin context
     if stdin_ctx and show.get("context", True):
         ctx_pct = stdin_ctx.get("context_pct")
         if ctx_pct is not None:
-            ctx_bar = make_bar(ctx_pct, theme, plain=bar_plain, width=bw, bar_style=bstyle)
+            ctx_bar = _make_bar_fast(ctx_pct, bar_colours, fill_ch, empty_ch, bw)
             ctx_fmt = config.get("context_format", "percent")
             ctx_used = stdin_ctx.get("context_used")
             ctx_limit = stdin_ctx.get("context_limit")
@@ -1833,7 +2440,7 @@ def build_status_line(usage, plan, config=None, stdin_ctx=None):
                 model_name = stdin_ctx.get("model_name", "")
                 window = MODEL_CONTEXT_WINDOWS.get(model_name, DEFAULT_CONTEXT_WINDOW)
                 ctx_limit = window
-                ctx_used = int(ctx_pct / 100 * window)
+                ctx_used = int(ctx_pct * window / 100)  # one rounding: 29% of 200k is 58000, not 57999
 
             if ctx_fmt == "tokens":
                 used_str = _fmt_tokens(ctx_used)
@@ -1842,14 +2449,7 @@ def build_status_line(usage, plan, config=None, stdin_ctx=None):
             else:
                 label = f"{ctx_pct:.0f}%"
 
-            if layout == "compact":
-                parts.append(f"C {ctx_bar} {label}")
-            elif layout == "minimal":
-                parts.append(f"{ctx_bar} {label}")
-            elif layout == "percent-first":
-                parts.append(f"{label} {ctx_bar}")
-            else:
-                parts.append(f"Context {ctx_bar} {label}")
+            parts.append(templates["context"].format(bar=ctx_bar, label=label))
 
     # Plan name (hidden in minimal layout)
     if layout != "minimal" and show.get("plan", True) and plan:
@@ -1858,8 +2458,7 @@ def build_status_line(usage, plan, config=None, stdin_ctx=None):
     # Streak display
     if show.get("streak", True):
         try:
-            stats = _load_stats()
-            sd = _get_streak_display(config, stats)
+            sd = _get_streak_display(config, _current_streak())
             if sd:
                 parts.append(sd)
         except Exception:
@@ -1880,6 +2479,8 @@ def build_status_line(usage, plan, config=None, stdin_ctx=None):
         text_color_code = resolve_text_color(config)
         if text_color_code:
             line = apply_text_color(line, text_color_code)
+        else:
+            line += RESET
 
     return line
 
@@ -1888,6 +2489,7 @@ def build_status_line(usage, plan, config=None, stdin_ctx=None):
 # Install
 # ---------------------------------------------------------------------------
 
+@functools.lru_cache(maxsize=1)
 def _get_python_cmd():
     """Return the Python command to use in hooks/settings.
 
@@ -1902,15 +2504,14 @@ def _get_python_cmd():
 
 
 def install_status_line():
-    settings_path = Path.home() / ".claude" / "settings.json"
-    script_path = Path(__file__).resolve()
+    settings_path = _claude_dir() / "settings.json"
+    script_path = _script_path()
     python_cmd = _get_python_cmd()
 
     settings = {}
     if settings_path.exists():
         try:
-            with open(settings_path, "r", encoding="utf-8") as f:
-                settings = json.load(f)
+            settings = _read_json(settings_path)
         except (json.JSONDecodeError, OSError):
             pass
 
@@ -1943,60 +2544,87 @@ def utf8_print(text):
     sys.stdout.buffer.write((text + "\n").encode("utf-8"))
 
 
+# DEC mode 2026 synchronized output — supporting terminals paint the block at
+# once, others ignore it. Only used on a TTY, never in the piped status line.
+SYNC_BEGIN = "\033[?2026h"
+SYNC_END = "\033[?2026l"
+
+
+def utf8_print_lines(*lines):
+    """Print several lines with a single UTF-8 write, synchronized on a terminal."""
+    text = "".join(ln + "\n" for ln in lines)
+    if sys.stdout.isatty():
+        text = SYNC_BEGIN + text + SYNC_END
+    sys.stdout.buffer.write(text.encode("utf-8"))
+
+
+def _theme_preview(name):
+    """Return the short colour preview bar for a theme."""
+    if name == "rainbow":
+        # Show a mini rainbow preview
+        return rainbow_colorize(FILL * 8)
+    return _PREVIEW_BAR.get(name, _PREVIEW_BAR["default"])
+
+
 def cmd_list_themes():
     """Print all available themes with a colour preview."""
-    utf8_print(f"\n{BOLD}Available themes:{RESET}\n")
+    out = []
+    out.append(f"\n{BOLD}Available themes:{RESET}\n")
     for name, colours in THEMES.items():
+        preview = _theme_preview(name)
         if name == "rainbow":
-            # Show a mini rainbow preview
-            preview = rainbow_colorize(FILL * 8)
-            utf8_print(f"  {name:<10} {preview}  (animated rainbow shimmer)")
+            out.append(f"  {name:<10} {preview}  (animated rainbow shimmer)")
         else:
-            low_bar = f"{colours['low']}{FILL * 3}{RESET}"
-            mid_bar = f"{colours['mid']}{FILL * 3}{RESET}"
-            high_bar = f"{colours['high']}{FILL * 2}{RESET}"
-            preview = f"{low_bar}{mid_bar}{high_bar}"
-            utf8_print(f"  {name:<10} {preview}  ({colours['low']}low{RESET} {colours['mid']}mid{RESET} {colours['high']}high{RESET})")
-    utf8_print("")
+            out.append(f"  {name:<10} {preview}  ({colours['low']}low{RESET} {colours['mid']}mid{RESET} {colours['high']}high{RESET})")
+    out.append("")
+    utf8_print_lines(*out)
+
+
+# Parts shown in theme previews — session, weekly, and plan only
+_PREVIEW_SHOW = {"session": True, "weekly": True, "plan": True, "timer": False, "extra": False, "sparkline": False, "runway": False, "status_message": False, "streak": False, "model": False, "context": False}
+_PREVIEW_USAGE = {
+    "five_hour": {"utilization": 42, "resets_at": None},
+    "seven_day": {"utilization": 67, "resets_at": None},
+}
+
+
+def _theme_preview_lines(bar_size, bar_style):
+    """Yield (theme, demo status line) pairs, reusing one demo config across themes."""
+    demo_config = {"bar_size": bar_size, "bar_style": bar_style, "show": _PREVIEW_SHOW}
+    for name in THEMES:
+        demo_config["theme"] = name
+        demo_config["text_color"] = THEME_DEMO_TEXT.get(name, "white")
+        yield name, build_status_line(_PREVIEW_USAGE, "Max 20x", demo_config)
 
 
 def cmd_themes_demo():
     """Print a simulated status line for each theme so users can see them in action."""
-    utf8_print(f"\n{BOLD}Theme previews:{RESET}\n")
-    demo_usage = {
-        "five_hour": {"utilization": 42, "resets_at": None},
-        "seven_day": {"utilization": 67, "resets_at": None},
-    }
+    out = []
+    out.append(f"\n{BOLD}Theme previews:{RESET}\n")
     user_config = load_config()
     current = user_config.get("theme", "default")
     user_bar_size = user_config.get("bar_size", DEFAULT_BAR_SIZE)
     user_bar_style = user_config.get("bar_style", DEFAULT_BAR_STYLE)
-    for name in THEMES:
-        demo_tc = THEME_DEMO_TEXT.get(name, "white")
-        demo_config = {"theme": name, "bar_size": user_bar_size, "bar_style": user_bar_style, "text_color": demo_tc, "show": {"session": True, "weekly": True, "plan": True, "timer": False, "extra": False, "sparkline": False, "runway": False, "status_message": False, "streak": False, "model": False, "context": False}}
-        line = build_status_line(demo_usage, "Max 20x", demo_config)
+    for name, line in _theme_preview_lines(user_bar_size, user_bar_style):
         marker = " <<" if name == current else ""
-        utf8_print(f"  {BOLD}{name:<10}{RESET} {line}{marker}")
-    utf8_print(f"\n  Set with: python claude_status.py --theme <name>\n")
+        out.append(f"  {BOLD}{name:<10}{RESET} {line}{marker}")
+    out.append(f"\n  Set with: python claude_status.py --theme <name>\n")
+    utf8_print_lines(*out)
 
 
-def cmd_show_themes():
+def cmd_show_themes(current_config=None):
     """Show all themes with live status line previews using accent colours."""
-    current_config = load_config()
+    out = []
+    if current_config is None:
+        current_config = load_config()
     current_theme = current_config.get("theme", "default")
     user_bar_size = current_config.get("bar_size", DEFAULT_BAR_SIZE)
 
-    utf8_print(f"\n{BOLD}Themes:{RESET}\n")
-    demo_usage = {
-        "five_hour": {"utilization": 42, "resets_at": None},
-        "seven_day": {"utilization": 67, "resets_at": None},
-    }
+    out.append(f"\n{BOLD}Themes:{RESET}\n")
     user_bar_style = current_config.get("bar_style", DEFAULT_BAR_STYLE)
-    for name in THEMES:
+    for name, line in _theme_preview_lines(user_bar_size, user_bar_style):
         # Use the accent colour so each theme looks distinct in the preview
         demo_tc = THEME_DEMO_TEXT.get(name, "white")
-        demo_config = {"theme": name, "bar_size": user_bar_size, "bar_style": user_bar_style, "text_color": demo_tc, "show": {"session": True, "weekly": True, "plan": True, "timer": False, "extra": False, "sparkline": False, "runway": False, "status_message": False, "streak": False, "model": False, "context": False}}
-        line = build_status_line(demo_usage, "Max 20x", demo_config)
         marker = f" {GREEN}<< current{RESET}" if name == current_theme else ""
         # Colour the theme name with its accent colour
         name_colour = TEXT_COLORS.get(demo_tc, "") if name != "rainbow" else ""
@@ -2004,66 +2632,65 @@ def cmd_show_themes():
             coloured_name = rainbow_colorize(f"{name:<10}", shimmer=False)
         else:
             coloured_name = f"{name_colour}{BOLD}{name:<10}{RESET}"
-        utf8_print(f"  {coloured_name} {line}{marker}")
-    utf8_print("")
+        out.append(f"  {coloured_name} {line}{marker}")
+    out.append("")
+    utf8_print_lines(*out)
 
 
-def cmd_show_colors():
+def cmd_show_colors(current_config=None):
     """Show all text colours with sample text."""
-    current_config = load_config()
+    out = []
+    if current_config is None:
+        current_config = load_config()
     current_theme = current_config.get("theme", "default")
     current_tc = current_config.get("text_color", "auto")
 
-    utf8_print(f"\n{BOLD}Text colours:{RESET}\n")
+    out.append(f"\n{BOLD}Text colours:{RESET}\n")
     sample = "Session 42% | Weekly 67%"
     for tc_name, tc_code in TEXT_COLORS.items():
         # Colour the name label with its own colour
         if tc_name == "none":
             coloured_label = f"{DIM}{tc_name:<14}{RESET}"
-            utf8_print(f"  {coloured_label} {DIM}(no colour applied){RESET}")
+            out.append(f"  {coloured_label} {DIM}(no colour applied){RESET}")
         elif tc_name == "default":
             coloured_label = f"\033[39m{tc_name:<14}{RESET}"
-            utf8_print(f"  {coloured_label} \033[39m{sample}{RESET}")
+            out.append(f"  {coloured_label} \033[39m{sample}{RESET}")
         elif tc_name == "dim":
             coloured_label = f"{tc_code}{tc_name:<14}{RESET}"
-            utf8_print(f"  {coloured_label} {tc_code}{sample}{RESET}")
+            out.append(f"  {coloured_label} {tc_code}{sample}{RESET}")
         else:
             coloured_label = f"{tc_code}{BOLD}{tc_name:<14}{RESET}"
-            utf8_print(f"  {coloured_label} {tc_code}{sample}{RESET}")
+            out.append(f"  {coloured_label} {tc_code}{sample}{RESET}")
     if current_tc == "auto":
         resolved = THEME_TEXT_DEFAULTS.get(current_theme, "white")
-        utf8_print(f"\n  Current: {BOLD}auto{RESET} (using {resolved} for {current_theme} theme)")
+        out.append(f"\n  Current: {BOLD}auto{RESET} (using {resolved} for {current_theme} theme)")
     else:
-        utf8_print(f"\n  Current: {BOLD}{current_tc}{RESET}")
-    utf8_print("")
+        out.append(f"\n  Current: {BOLD}{current_tc}{RESET}")
+    out.append("")
+    utf8_print_lines(*out)
 
 
 def cmd_show_all():
     """Show all themes and text colours with visual previews."""
-    cmd_show_themes()
-    cmd_show_colors()
+    config = load_config()
+    cmd_show_themes(config)
+    cmd_show_colors(config)
 
 
 def cmd_set_theme(name):
     """Set the active theme and save to config."""
     if name not in THEMES:
-        utf8_print(f"Unknown theme: {_sanitize(name)}")
-        utf8_print(f"Available: {', '.join(THEMES.keys())}")
+        utf8_print_lines(
+            f"Unknown theme: {_sanitize(name)}",
+            f"Available: {', '.join(THEMES.keys())}",
+        )
         return
     config = load_config()
     config["theme"] = name
     save_config(config)
     # Clear the cache so the new theme takes effect immediately
-    try:
-        os.remove(get_cache_path())
-    except OSError:
-        pass
-    if name == "rainbow":
-        preview = rainbow_colorize(FILL * 8)
-    else:
-        colours = THEMES[name]
-        preview = f"{colours['low']}{FILL * 3}{colours['mid']}{FILL * 3}{colours['high']}{FILL * 2}{RESET}"
-    utf8_print(f"Theme set to {BOLD}{name}{RESET}  {preview}")
+    clear_cache()
+    utf8_print(f"Theme set to {BOLD}{name}{RESET}  {_theme_preview(name)}")
 
 
 def cmd_show(parts_str):
@@ -2104,31 +2731,28 @@ def cmd_hide(parts_str):
 
 def cmd_print_config():
     """Print the current configuration summary."""
+    out = []
     config = load_config()
     theme_name = config.get("theme", "default")
 
-    if theme_name == "rainbow":
-        preview = rainbow_colorize(FILL * 8)
-    else:
-        colours = THEMES.get(theme_name, THEMES["default"])
-        preview = f"{colours['low']}{FILL * 3}{colours['mid']}{FILL * 3}{colours['high']}{FILL * 2}{RESET}"
+    preview = _theme_preview(theme_name)
 
-    utf8_print(f"\n{BOLD}claude-pulse v{VERSION}{RESET}\n")
-    utf8_print(f"  Theme:     {theme_name}  {preview}")
-    utf8_print(f"  Cache TTL: {config.get('cache_ttl_seconds', DEFAULT_CACHE_TTL)}s")
-    utf8_print(f"  Currency:  {_sanitize(config.get('currency', chr(163)))}")
+    out.append(f"\n{BOLD}claude-pulse v{VERSION}{RESET}\n")
+    out.append(f"  Theme:     {theme_name}  {preview}")
+    out.append(f"  Cache TTL: {config.get('cache_ttl_seconds', DEFAULT_CACHE_TTL)}s")
+    out.append(f"  Currency:  {_sanitize(config.get('currency', chr(163)))}")
     bs = config.get("bar_size", DEFAULT_BAR_SIZE)
     bw_display = BAR_SIZES.get(bs, BAR_SIZES[DEFAULT_BAR_SIZE])
-    utf8_print(f"  Bar size:  {bs} ({bw_display} chars)")
+    out.append(f"  Bar size:  {bs} ({bw_display} chars)")
     bst = config.get("bar_style", DEFAULT_BAR_STYLE)
     bst_chars = BAR_STYLES.get(bst, BAR_STYLES[DEFAULT_BAR_STYLE])
-    utf8_print(f"  Bar style: {bst} ({bst_chars[0]}{bst_chars[1]})")
+    out.append(f"  Bar style: {bst} ({bst_chars[0]}{bst_chars[1]})")
     ly = config.get("layout", DEFAULT_LAYOUT)
-    utf8_print(f"  Layout:    {ly}")
+    out.append(f"  Layout:    {ly}")
     cf = config.get("context_format", "percent")
-    utf8_print(f"  Context:   {cf}")
+    out.append(f"  Context:   {cf}")
     ed = config.get("extra_display", "auto")
-    utf8_print(f"  Extra display: {ed}")
+    out.append(f"  Extra display: {ed}")
     show = config.get("show", DEFAULT_SHOW)
     wt_fmt = _sanitize(str(config.get("weekly_timer_format", DEFAULT_WEEKLY_TIMER_FORMAT)))
     if wt_fmt not in WEEKLY_TIMER_FORMATS:
@@ -2136,57 +2760,54 @@ def cmd_print_config():
     wt_pfx = _sanitize(str(config.get("weekly_timer_prefix", DEFAULT_WEEKLY_TIMER_PREFIX)))[:10]
     wt_vis = show.get("weekly_timer", True)
     wt_state = f"{GREEN}on{RESET}" if wt_vis else f"{RED}off{RESET}"
-    utf8_print(f"  Weekly timer:  {wt_state}  format={wt_fmt}  prefix=\"{wt_pfx}\"")
+    out.append(f"  Weekly timer:  {wt_state}  format={wt_fmt}  prefix=\"{wt_pfx}\"")
     anim = config.get("animate", False)
     anim_state = f"{GREEN}on{RESET}" if anim else f"{RED}off{RESET}"
-    utf8_print(f"  Animation:    {anim_state}  ({'rainbow always moving' if anim else 'static'})")
+    out.append(f"  Animation:    {anim_state}  ({'rainbow always moving' if anim else 'static'})")
     tc = config.get("text_color", "auto")
     if tc == "auto":
         resolved = THEME_TEXT_DEFAULTS.get(theme_name, "white")
         tc_code = TEXT_COLORS.get(resolved, "")
-        utf8_print(f"  Text colour:  {tc_code}auto{RESET}  (using {tc_code}{resolved}{RESET} for {theme_name} theme)")
+        out.append(f"  Text colour:  {tc_code}auto{RESET}  (using {tc_code}{resolved}{RESET} for {theme_name} theme)")
     else:
         tc_code = TEXT_COLORS.get(tc, "")
-        utf8_print(f"  Text colour:  {tc_code}{tc}{RESET}")
-    # Update check
+        out.append(f"  Text colour:  {tc_code}{tc}{RESET}")
+    # Update check — flush what we have before any network round-trip
+    _flush_lines(out)
     local = get_local_commit()
     if local:
         update = check_for_update()
         if update:
-            utf8_print(f"  Update:       {BRIGHT_YELLOW}available{RESET}  (run {BOLD}/pulse update{RESET} or {BOLD}--update{RESET})")
+            out.append(f"  Update:       {BRIGHT_YELLOW}available{RESET}  (run {BOLD}/pulse update{RESET} or {BOLD}--update{RESET})")
         elif update is False:
-            utf8_print(f"  Update:       {GREEN}up to date (v{VERSION}){RESET}")
+            out.append(f"  Update:       {GREEN}up to date (v{VERSION}){RESET}")
         else:
-            utf8_print(f"  Update:       {DIM}check failed{RESET}")
+            out.append(f"  Update:       {DIM}check failed{RESET}")
     # Claude Code update check
-    if _CLAUDE_PATH:
+    claude_path = _claude_path()
+    if claude_path:
         try:
-            result = subprocess.run(
-                [_CLAUDE_PATH, "--version"],
-                capture_output=True, text=True, timeout=3,
-            )
-            if result.returncode == 0:
-                local_ver = _sanitize(result.stdout.strip().split()[0])
+            local_ver = _claude_local_version(claude_path)
+            if local_ver:
                 cc_update = check_claude_code_update()
                 if cc_update:
                     # Read cached remote version
                     try:
-                        cc_cache_path = get_state_dir() / "claude_code_update.json"
-                        with open(cc_cache_path, "r", encoding="utf-8") as f:
-                            cc_cached = json.load(f)
+                        cc_cached = load_state()[CLAUDE_UPDATE_KEY]
                         remote_ver = _sanitize(cc_cached.get("remote", "?"))
                     except Exception:
                         remote_ver = "newer"
-                    utf8_print(f"  Claude Code:  {BRIGHT_YELLOW}{local_ver} \u2192 {remote_ver} available{RESET}  (run {BOLD}claude update{RESET} in a new terminal)")
+                    out.append(f"  Claude Code:  {BRIGHT_YELLOW}{local_ver} \u2192 {remote_ver} available{RESET}  (run {BOLD}claude update{RESET} in a new terminal)")
                 elif cc_update is False:
-                    utf8_print(f"  Claude Code:  {GREEN}{local_ver} (up to date){RESET}")
+                    out.append(f"  Claude Code:  {GREEN}{local_ver} (up to date){RESET}")
                 else:
-                    utf8_print(f"  Claude Code:  {DIM}{local_ver} (check failed){RESET}")
+                    out.append(f"  Claude Code:  {DIM}{local_ver} (check failed){RESET}")
         except Exception:
-            utf8_print(f"  Claude Code:  {DIM}check failed{RESET}")
+            out.append(f"  Claude Code:  {DIM}check failed{RESET}")
 
     # Extra credits status — check the API
-    utf8_print(f"\n  {BOLD}Extra Credits:{RESET}")
+    out.append(f"\n  {BOLD}Extra Credits:{RESET}")
+    _flush_lines(out)
     try:
         token, _ = get_credentials()
         if token:
@@ -2197,377 +2818,445 @@ def cmd_print_config():
                 used = (_extra.get("used_credits") or 0) / 100  # API returns pence/cents
                 limit = (_extra.get("monthly_limit") or 0) / 100
                 pct = min(_extra.get("utilization") or 0, 100)
-                utf8_print(f"    Status:    {GREEN}active{RESET}")
-                utf8_print(f"    Used:      {currency}{used:.2f} / {currency}{limit:.2f} ({pct:.0f}%)")
+                out.append(f"    Status:    {GREEN}active{RESET}")
+                out.append(f"    Used:      {currency}{used:.2f} / {currency}{limit:.2f} ({pct:.0f}%)")
                 if config.get("extra_hidden"):
-                    utf8_print(f"    Display:   {RED}hidden{RESET}  (run {BOLD}--show extra{RESET} to re-enable)")
+                    out.append(f"    Display:   {RED}hidden{RESET}  (run {BOLD}--show extra{RESET} to re-enable)")
                 else:
-                    utf8_print(f"    Display:   {GREEN}auto-shown{RESET}  (run {BOLD}--hide extra{RESET} to suppress)")
+                    out.append(f"    Display:   {GREEN}auto-shown{RESET}  (run {BOLD}--hide extra{RESET} to suppress)")
             else:
-                utf8_print(f"    Status:    {DIM}not active{RESET}")
+                out.append(f"    Status:    {DIM}not active{RESET}")
                 if show.get("extra", False):
-                    utf8_print(f"    Display:   {GREEN}on{RESET} (forced)  — will show 'none' until credits are gifted")
+                    out.append(f"    Display:   {GREEN}on{RESET} (forced)  — will show 'none' until credits are gifted")
                 else:
-                    utf8_print(f"    Display:   {DIM}auto{RESET} — will appear when credits are gifted")
+                    out.append(f"    Display:   {DIM}auto{RESET} — will appear when credits are gifted")
         else:
-            utf8_print(f"    Status:    {DIM}unknown{RESET} (no credentials)")
+            out.append(f"    Status:    {DIM}unknown{RESET} (no credentials)")
     except Exception:
-        utf8_print(f"    Status:    {DIM}check failed{RESET}")
+        out.append(f"    Status:    {DIM}check failed{RESET}")
 
-    utf8_print(f"\n  {BOLD}Visibility:{RESET}")
+    out.append(f"\n  {BOLD}Visibility:{RESET}")
     for key in DEFAULT_SHOW:
         state = f"{GREEN}on{RESET}" if show.get(key, DEFAULT_SHOW[key]) else f"{RED}off{RESET}"
-        utf8_print(f"    {key:<10} {state}")
-    utf8_print("")
+        out.append(f"    {key:<10} {state}")
+    out.append("")
+    _flush_lines(out)
 
 
 # ---------------------------------------------------------------------------
-# Main
+# CLI flags
 # ---------------------------------------------------------------------------
 
-def main():
-    # Handle SIGPIPE gracefully on Unix (e.g. when piped to head)
-    if hasattr(signal, "SIGPIPE"):
-        signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+def _cli_theme(val):
+    """Handle --theme <value>."""
+    if val is None:
+        utf8_print("Usage: --theme <name>")
+        return
+    cmd_set_theme(val)
 
-    args = sys.argv[1:]
 
-    if "--update" in args:
-        cmd_update()
+def _cli_show(val):
+    """Handle --show <value>."""
+    if val is None:
+        utf8_print("Usage: --show <parts>  (comma-separated: session,weekly,plan,timer,extra,update)")
         return
+    cmd_show(val)
 
-    if "--install" in args:
-        install_status_line()
-        return
 
-    if "--show-all" in args:
-        cmd_show_all()
+def _cli_hide(val):
+    """Handle --hide <value>."""
+    if val is None:
+        utf8_print("Usage: --hide <parts>  (comma-separated: session,weekly,plan,timer,extra,update)")
         return
+    cmd_hide(val)
 
-    if "--show-themes" in args:
-        cmd_show_themes()
-        return
 
-    if "--show-colors" in args:
-        cmd_show_colors()
+def _cli_text_color(val):
+    """Handle --text-color <value>."""
+    if val is None:
+        utf8_print_lines(
+            "Usage: --text-color <name>",
+            f"Available: auto, {', '.join(TEXT_COLORS.keys())}",
+        )
         return
-
-    if "--themes-demo" in args:
-        cmd_themes_demo()
+    val = val.lower()
+    if val not in TEXT_COLORS and val != "auto":
+        utf8_print_lines(
+            f"Unknown colour: {_sanitize(val)}",
+            f"Available: auto, {', '.join(TEXT_COLORS.keys())}",
+        )
         return
+    config = load_config()
+    config["text_color"] = val
+    save_config(config)
+    clear_cache()
+    if val == "auto":
+        resolved = THEME_TEXT_DEFAULTS.get(config.get("theme", "default"), "white")
+        utf8_print(f"Text colour: {BOLD}auto{RESET} (using {resolved} for {config.get('theme', 'default')} theme)")
+    else:
+        code = TEXT_COLORS.get(val, "")
+        utf8_print(f"Text colour: {code}{BOLD}{val}{RESET}")
 
-    if "--themes" in args:
-        cmd_list_themes()
-        return
 
-    if "--theme" in args:
-        idx = args.index("--theme")
-        if idx + 1 < len(args):
-            cmd_set_theme(args[idx + 1])
-        else:
-            utf8_print("Usage: --theme <name>")
+def _cli_animate(val):
+    """Handle --animate <value>."""
+    if val is None:
+        utf8_print("Usage: --animate on|off")
         return
-
-    if "--show" in args:
-        idx = args.index("--show")
-        if idx + 1 < len(args):
-            cmd_show(args[idx + 1])
-        else:
-            utf8_print("Usage: --show <parts>  (comma-separated: session,weekly,plan,timer,extra,update)")
+    val = val.lower()
+    if val in ("on", "true", "yes", "1"):
+        anim = True
+    elif val in ("off", "false", "no", "0"):
+        anim = False
+    else:
+        utf8_print(f"Unknown value: {_sanitize(val)}  (use on or off)")
         return
+    config = load_config()
+    config["animate"] = anim
+    save_config(config)
+    clear_cache()
+    if anim:
+        utf8_print(f"Animation: {GREEN}on{RESET}  (rainbow always moving)")
+    else:
+        utf8_print(f"Animation: {RED}off{RESET}  (static)")
 
-    if "--hide" in args:
-        idx = args.index("--hide")
-        if idx + 1 < len(args):
-            cmd_hide(args[idx + 1])
-        else:
-            utf8_print("Usage: --hide <parts>  (comma-separated: session,weekly,plan,timer,extra,update)")
-        return
 
-    if "--text-color" in args:
-        idx = args.index("--text-color")
-        if idx + 1 < len(args):
-            val = args[idx + 1].lower()
-            if val not in TEXT_COLORS and val != "auto":
-                utf8_print(f"Unknown colour: {_sanitize(val)}")
-                utf8_print(f"Available: auto, {', '.join(TEXT_COLORS.keys())}")
-                return
-            config = load_config()
-            config["text_color"] = val
-            save_config(config)
-            try:
-                os.remove(get_cache_path())
-            except OSError:
-                pass
-            if val == "auto":
-                resolved = THEME_TEXT_DEFAULTS.get(config.get("theme", "default"), "white")
-                utf8_print(f"Text colour: {BOLD}auto{RESET} (using {resolved} for {config.get('theme', 'default')} theme)")
-            else:
-                code = TEXT_COLORS.get(val, "")
-                utf8_print(f"Text colour: {code}{BOLD}{val}{RESET}")
-        else:
-            utf8_print(f"Usage: --text-color <name>")
-            utf8_print(f"Available: auto, {', '.join(TEXT_COLORS.keys())}")
+def _cli_bar_size(val):
+    """Handle --bar-size <value>."""
+    if val is None:
+        utf8_print_lines(
+            "Usage: --bar-size <small|medium|large>",
+            *(f"  {name:<8} {GREEN}{FILL * width}{RESET}  ({width} chars)" for name, width in BAR_SIZES.items()),
+        )
         return
-
-    if "--animate" in args:
-        idx = args.index("--animate")
-        if idx + 1 < len(args):
-            val = args[idx + 1].lower()
-            if val in ("on", "true", "yes", "1"):
-                anim = True
-            elif val in ("off", "false", "no", "0"):
-                anim = False
-            else:
-                utf8_print(f"Unknown value: {_sanitize(val)}  (use on or off)")
-                return
-            config = load_config()
-            config["animate"] = anim
-            save_config(config)
-            try:
-                os.remove(get_cache_path())
-            except OSError:
-                pass
-            if anim:
-                utf8_print(f"Animation: {GREEN}on{RESET}  (rainbow always moving)")
-            else:
-                utf8_print(f"Animation: {RED}off{RESET}  (static)")
-        else:
-            utf8_print("Usage: --animate on|off")
+    val = val.lower()
+    if val not in BAR_SIZES:
+        utf8_print_lines(
+            f"Unknown size: {_sanitize(val)}",
+            f"Available: {', '.join(BAR_SIZES.keys())}",
+        )
         return
+    config = load_config()
+    config["bar_size"] = val
+    save_config(config)
+    clear_cache()
+    bw = BAR_SIZES[val]
+    demo_bar = f"{GREEN}{FILL * bw}{RESET}"
+    utf8_print(f"Bar size: {BOLD}{val}{RESET} ({bw} chars)  {demo_bar}")
 
-    if "--bar-size" in args:
-        idx = args.index("--bar-size")
-        if idx + 1 < len(args):
-            val = args[idx + 1].lower()
-            if val not in BAR_SIZES:
-                utf8_print(f"Unknown size: {_sanitize(val)}")
-                utf8_print(f"Available: {', '.join(BAR_SIZES.keys())}")
-                return
-            config = load_config()
-            config["bar_size"] = val
-            save_config(config)
-            try:
-                os.remove(get_cache_path())
-            except OSError:
-                pass
-            bw = BAR_SIZES[val]
-            demo_bar = f"{GREEN}{FILL * bw}{RESET}"
-            utf8_print(f"Bar size: {BOLD}{val}{RESET} ({bw} chars)  {demo_bar}")
-        else:
-            utf8_print(f"Usage: --bar-size <small|medium|large>")
-            for name, width in BAR_SIZES.items():
-                demo = f"{GREEN}{FILL * width}{RESET}"
-                utf8_print(f"  {name:<8} {demo}  ({width} chars)")
-        return
 
-    if "--bar-style" in args:
-        idx = args.index("--bar-style")
-        if idx + 1 < len(args):
-            val = args[idx + 1].lower()
-            if val not in BAR_STYLES:
-                utf8_print(f"Unknown style: {_sanitize(val)}")
-                utf8_print(f"Available: {', '.join(BAR_STYLES.keys())}")
-                return
-            config = load_config()
-            config["bar_style"] = val
-            save_config(config)
-            try:
-                os.remove(get_cache_path())
-            except OSError:
-                pass
-            fill_ch, empty_ch = BAR_STYLES[val]
-            demo = f"{GREEN}{fill_ch * 4}{DIM}{empty_ch * 4}{RESET}"
-            utf8_print(f"Bar style: {BOLD}{val}{RESET}  {demo}")
-        else:
-            utf8_print(f"Usage: --bar-style <name>\n")
-            for name, (fc, ec) in BAR_STYLES.items():
-                demo = f"{GREEN}{fc * 4}{DIM}{ec * 4}{RESET}"
-                utf8_print(f"  {name:<10} {demo}")
+def _cli_bar_style(val):
+    """Handle --bar-style <value>."""
+    if val is None:
+        sys.stdout.buffer.write(b"Usage: --bar-style <name>\n\n" + _BAR_STYLE_DEMO_BYTES)
         return
-
-    if "--extra-display" in args:
-        idx = args.index("--extra-display")
-        if idx + 1 < len(args):
-            val = args[idx + 1].lower()
-            if val not in ("auto", "full", "amount"):
-                utf8_print(f"Unknown value: {_sanitize(val)}  (use auto, full, or amount)")
-                return
-            config = load_config()
-            config["extra_display"] = val
-            save_config(config)
-            try:
-                os.remove(get_cache_path())
-            except OSError:
-                pass
-            descriptions = {
-                "auto": "auto-detects (amount only if no spending limit, full bar otherwise)",
-                "full": "progress bar with amount and limit",
-                "amount": "spend amount only, no bar",
-            }
-            utf8_print(f"Extra display: {BOLD}{val}{RESET}  ({descriptions[val]})")
-        else:
-            utf8_print("Usage: --extra-display <auto|full|amount>")
-            utf8_print(f"  {'auto':<8} Auto-detect (amount only if no spending limit)")
-            utf8_print(f"  {'full':<8} Progress bar with amount and limit")
-            utf8_print(f"  {'amount':<8} Spend amount only, no bar")
+    val = val.lower()
+    if val not in BAR_STYLES:
+        utf8_print_lines(
+            f"Unknown style: {_sanitize(val)}",
+            f"Available: {', '.join(BAR_STYLES.keys())}",
+        )
         return
-
-    if "--context-format" in args:
-        idx = args.index("--context-format")
-        if idx + 1 < len(args):
-            val = args[idx + 1].lower()
-            if val not in ("percent", "tokens"):
-                utf8_print(f"Unknown format: {_sanitize(val)}  (use percent or tokens)")
-                return
-            config = load_config()
-            config["context_format"] = val
-            save_config(config)
-            try:
-                os.remove(get_cache_path())
-            except OSError:
-                pass
-            utf8_print(f"Context format: {BOLD}{val}{RESET}")
-            if val == "tokens":
-                utf8_print(f"{DIM}  Note: Claude Code uses a 200k context window.")
-                utf8_print(f"  The 1M window is an API-only beta feature and not used here.{RESET}")
-        else:
-            utf8_print("Usage: --context-format percent|tokens")
+    config = load_config()
+    config["bar_style"] = val
+    save_config(config)
+    clear_cache()
+    fill_ch, empty_ch = BAR_STYLES[val]
+    demo = f"{GREEN}{fill_ch * 4}{DIM}{empty_ch * 4}{RESET}"
+    utf8_print(f"Bar style: {BOLD}{val}{RESET}  {demo}")
+
+
+def _cli_extra_display(val):
+    """Handle --extra-display <value>."""
+    if val is None:
+        utf8_print_lines(
+            "Usage: --extra-display <auto|full|amount>",
+            f"  {'auto':<8} Auto-detect (amount only if no spending limit)",
+            f"  {'full':<8} Progress bar with amount and limit",
+            f"  {'amount':<8} Spend amount only, no bar",
+        )
         return
+    val = val.lower()
+    if val not in ("auto", "full", "amount"):
+        utf8_print(f"Unknown value: {_sanitize(val)}  (use auto, full, or amount)")
+        return
+    config = load_config()
+    config["extra_display"] = val
+    save_config(config)
+    clear_cache()
+    descriptions = {
+        "auto": "auto-detects (amount only if no spending limit, full bar otherwise)",
+        "full": "progress bar with amount and limit",
+        "amount": "spend amount only, no bar",
+    }
+    utf8_print(f"Extra display: {BOLD}{val}{RESET}  ({descriptions[val]})")
 
-    if "--layout" in args:
-        idx = args.index("--layout")
-        if idx + 1 < len(args):
-            val = args[idx + 1].lower()
-            if val not in LAYOUTS:
-                utf8_print(f"Unknown layout: {_sanitize(val)}")
-                utf8_print(f"Available: {', '.join(LAYOUTS)}")
-                return
-            config = load_config()
-            config["layout"] = val
-            save_config(config)
-            try:
-                os.remove(get_cache_path())
-            except OSError:
-                pass
-            utf8_print(f"Layout: {BOLD}{val}{RESET}")
-        else:
-            utf8_print(f"Usage: --layout <name>")
-            utf8_print(f"Available: {', '.join(LAYOUTS)}")
+
+def _cli_context_format(val):
+    """Handle --context-format <value>."""
+    if val is None:
+        utf8_print("Usage: --context-format percent|tokens")
         return
+    val = val.lower()
+    if val not in ("percent", "tokens"):
+        utf8_print(f"Unknown format: {_sanitize(val)}  (use percent or tokens)")
+        return
+    config = load_config()
+    config["context_format"] = val
+    save_config(config)
+    clear_cache()
+    utf8_print(f"Context format: {BOLD}{val}{RESET}")
+    if val == "tokens":
+        utf8_print_lines(
+            f"{DIM}  Note: Claude Code uses a 200k context window.",
+            f"  The 1M window is an API-only beta feature and not used here.{RESET}",
+        )
 
-    if "--currency" in args:
-        idx = args.index("--currency")
-        if idx + 1 < len(args):
-            val = _sanitize(args[idx + 1])[:5]  # strip escapes, max 5 chars
-            config = load_config()
-            config["currency"] = val
-            save_config(config)
-            try:
-                os.remove(get_cache_path())
-            except OSError:
-                pass
-            utf8_print(f"Currency symbol: {BOLD}{val}{RESET}")
-        else:
-            utf8_print("Usage: --currency <symbol>  (e.g. \u00a3, $, \u20ac, \u00a5)")
+
+def _cli_layout(val):
+    """Handle --layout <value>."""
+    if val is None:
+        utf8_print_lines(
+            "Usage: --layout <name>",
+            f"Available: {', '.join(LAYOUTS)}",
+        )
+        return
+    val = val.lower()
+    if val not in LAYOUTS:
+        utf8_print_lines(
+            f"Unknown layout: {_sanitize(val)}",
+            f"Available: {', '.join(LAYOUTS)}",
+        )
         return
+    config = load_config()
+    config["layout"] = val
+    save_config(config)
+    rerender_cache(config)
+    utf8_print(f"Layout: {BOLD}{val}{RESET}")
 
-    if "--weekly-timer-format" in args:
-        idx = args.index("--weekly-timer-format")
-        if idx + 1 < len(args):
-            val = args[idx + 1].lower()
-            if val not in WEEKLY_TIMER_FORMATS:
-                utf8_print(f"Unknown format: {_sanitize(val)}")
-                utf8_print(f"Available: {', '.join(WEEKLY_TIMER_FORMATS)}")
-                return
-            config = load_config()
-            config["weekly_timer_format"] = val
-            save_config(config)
-            try:
-                os.remove(get_cache_path())
-            except OSError:
-                pass
-            descriptions = {
-                "auto": "date when >24h, countdown when <24h",
-                "countdown": "always show countdown (2d 5h / 14h 22m)",
-                "date": "always show date (Sat 5pm)",
-                "full": "both date and countdown (Sat 5pm \u00b7 2d 5h)",
-            }
-            utf8_print(f"Weekly timer format: {BOLD}{val}{RESET}  ({descriptions[val]})")
-        else:
-            utf8_print(f"Usage: --weekly-timer-format <mode>\n")
-            utf8_print(f"  auto       date when >24h, countdown when <24h (default)")
-            utf8_print(f"  countdown  always show countdown: 2d 5h / 14h 22m / 45m")
-            utf8_print(f"  date       always show date: Sat 5pm")
-            utf8_print(f"  full       both: Sat 5pm \u00b7 2d 5h")
+
+def _cli_currency(val):
+    """Handle --currency <value>."""
+    if val is None:
+        utf8_print("Usage: --currency <symbol>  (e.g. \u00a3, $, \u20ac, \u00a5)")
         return
+    val = _sanitize(val)[:5]  # strip escapes, max 5 chars
+    config = load_config()
+    config["currency"] = val
+    save_config(config)
+    rerender_cache(config)
+    utf8_print(f"Currency symbol: {BOLD}{val}{RESET}")
+
+
+def _cli_weekly_timer_format(val):
+    """Handle --weekly-timer-format <value>."""
+    if val is None:
+        utf8_print_lines(
+            "Usage: --weekly-timer-format <mode>\n",
+            "  auto       date when >24h, countdown when <24h (default)",
+            "  countdown  always show countdown: 2d 5h / 14h 22m / 45m",
+            "  date       always show date: Sat 5pm",
+            "  full       both: Sat 5pm \u00b7 2d 5h",
+        )
+        return
+    val = val.lower()
+    if val not in WEEKLY_TIMER_FORMATS:
+        utf8_print_lines(
+            f"Unknown format: {_sanitize(val)}",
+            f"Available: {', '.join(WEEKLY_TIMER_FORMATS)}",
+        )
+        return
+    config = load_config()
+    config["weekly_timer_format"] = val
+    save_config(config)
+    clear_cache()
+    utf8_print(f"Weekly timer format: {BOLD}{val}{RESET}  ({WEEKLY_TIMER_DESCRIPTIONS[val]})")
 
-    if "--weekly-timer-prefix" in args:
-        idx = args.index("--weekly-timer-prefix")
-        if idx + 1 < len(args):
-            val = _sanitize(args[idx + 1])[:10]  # strip escapes, max 10 chars
-            config = load_config()
-            config["weekly_timer_prefix"] = val
-            save_config(config)
-            try:
-                os.remove(get_cache_path())
-            except OSError:
-                pass
-            if val:
-                utf8_print(f"Weekly timer prefix: {BOLD}{val}{RESET}")
-            else:
-                utf8_print(f"Weekly timer prefix: {DIM}(none){RESET}")
-        else:
-            utf8_print('Usage: --weekly-timer-prefix <text>  (e.g. "R:", "Resets:", "")')
+
+def _cli_weekly_timer_prefix(val):
+    """Handle --weekly-timer-prefix <value>."""
+    if val is None:
+        utf8_print('Usage: --weekly-timer-prefix <text>  (e.g. "R:", "Resets:", "")')
         return
+    val = _sanitize(val)[:10]  # strip escapes, max 10 chars
+    config = load_config()
+    config["weekly_timer_prefix"] = val
+    save_config(config)
+    clear_cache()
+    if val:
+        utf8_print(f"Weekly timer prefix: {BOLD}{val}{RESET}")
+    else:
+        utf8_print(f"Weekly timer prefix: {DIM}(none){RESET}")
 
-    if "--stats" in args:
-        cmd_stats()
+
+def _cli_streak_style(val):
+    """Handle --streak-style <value>."""
+    if val is None:
+        utf8_print("Usage: --streak-style fire|text")
+        return
+    val = val.lower()
+    if val not in ("fire", "text"):
+        utf8_print(f"Unknown streak style: {_sanitize(val)}  (use fire or text)")
         return
+    config = load_config()
+    config["streak_style"] = val
+    save_config(config)
+    utf8_print(f"Streak style: {BOLD}{val}{RESET}")
 
-    if "--streak-style" in args:
-        idx = args.index("--streak-style")
-        if idx + 1 < len(args):
-            val = args[idx + 1].lower()
-            if val not in ("fire", "text"):
-                utf8_print(f"Unknown streak style: {_sanitize(val)}  (use fire or text)")
-                return
-            config = load_config()
-            config["streak_style"] = val
-            save_config(config)
-            utf8_print(f"Streak style: {BOLD}{val}{RESET}")
-        else:
-            utf8_print("Usage: --streak-style fire|text")
+
+def _cli_debug_stdin():
+    """Handle --debug-stdin."""
+    raw = b""
+    if sys.stdin.isatty():
+        utf8_print("No stdin data (interactive terminal). Pipe data or use from Claude Code.")
         return
+    try:
+        raw = sys.stdin.buffer.read(65536)  # the exact bytes Claude Code sent
+    except Exception:
+        pass
+    debug_path = get_state_dir() / "stdin_debug.json"
+    try:
+        with _secure_open_write(debug_path, binary=True) as f:
+            f.write(raw if raw else b"{}")
+    except OSError:
+        pass
+    utf8_print(f"Stdin debug written to: {debug_path}")
+    if raw.strip():
+        ctx = _parse_stdin_context(raw)
+        utf8_print(f"Parsed context: {json.dumps(ctx, indent=2)}")
+
+
+# Flag dispatch in priority order: the first flag listed here that appears
+# anywhere in argv wins. Entries with True take the following argument.
+_CLI_COMMANDS = (
+    ("--update", cmd_update, False),
+    ("--install", install_status_line, False),
+    ("--show-all", cmd_show_all, False),
+    ("--show-themes", cmd_show_themes, False),
+    ("--show-colors", cmd_show_colors, False),
+    ("--themes-demo", cmd_themes_demo, False),
+    ("--themes", cmd_list_themes, False),
+    ("--theme", _cli_theme, True),
+    ("--show", _cli_show, True),
+    ("--hide", _cli_hide, True),
+    ("--text-color", _cli_text_color, True),
+    ("--animate", _cli_animate, True),
+    ("--bar-size", _cli_bar_size, True),
+    ("--bar-style", _cli_bar_style, True),
+    ("--extra-display", _cli_extra_display, True),
+    ("--context-format", _cli_context_format, True),
+    ("--layout", _cli_layout, True),
+    ("--currency", _cli_currency, True),
+    ("--weekly-timer-format", _cli_weekly_timer_format, True),
+    ("--weekly-timer-prefix", _cli_weekly_timer_prefix, True),
+    ("--stats", cmd_stats, False),
+    ("--streak-style", _cli_streak_style, True),
+    ("--debug-stdin", _cli_debug_stdin, False),
+    ("--heatmap", cmd_heatmap, False),
+    ("--config", cmd_print_config, False),
+)
 
-    if "--debug-stdin" in args:
-        raw = ""
-        if sys.stdin.isatty():
-            utf8_print("No stdin data (interactive terminal). Pipe data or use from Claude Code.")
-            return
-        try:
-            raw = sys.stdin.read(65536)
-        except Exception:
-            pass
-        debug_path = get_state_dir() / "stdin_debug.json"
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+def _prefetch_update_checks(config):
+    """Run both update checks concurrently when both would hit the network.
+
+    Returns (pulse_update, claude_update) as booleans, or None when the
+    indicators should run their own checks (fresh cache, one hidden, or error).
+    """
+    show = config.get("show", DEFAULT_SHOW)
+    if not (show.get("update", True) and show.get("claude_update", True)):
+        return None
+    # read_cache stats state.json first, so fresh entries cost no thread spin-up
+    if read_cache(PULSE_UPDATE_KEY, UPDATE_CHECK_TTL) is not None \
+            or read_cache(CLAUDE_UPDATE_KEY, UPDATE_CHECK_TTL) is not None:
+        return None
+    load_state()  # load before the workers so they share one state dict
+    from concurrent.futures import ThreadPoolExecutor
+    try:
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            futures = [ex.submit(check_for_update), ex.submit(check_claude_code_update)]
+            # A failed check (None) shows no indicator, same as when run serially
+            return tuple(bool(f.result()) for f in futures)
+    except Exception:
+        return None  # the indicators fall back to running the checks serially
+
+
+def _cached_update_flag(key):
+    """Update-available flag from a fresh cached check, without any network."""
+    cached = read_cache(key, UPDATE_CHECK_TTL)
+    return bool(cached and cached.get("update_available"))
+
+
+def _close_stdout():
+    """Give the reader EOF now, ahead of any work left after the status line.
+
+    sys.stdout.close() alone leaves fd 1 open (closefd=False). The descriptor
+    is pointed at the null device instead: that closes our end of the pipe,
+    and fd 1 stays taken so no file opened later can land on it.
+    """
+    try:
+        sys.stdout.flush()
+        fd = sys.stdout.fileno()
+        null = os.open(os.devnull, os.O_WRONLY)
         try:
-            with _secure_open_write(debug_path) as f:
-                f.write(raw if raw else "{}")
-        except OSError:
-            pass
-        utf8_print(f"Stdin debug written to: {debug_path}")
-        if raw.strip():
-            ctx = _parse_stdin_context(raw)
-            utf8_print(f"Parsed context: {json.dumps(ctx, indent=2)}")
-        return
+            os.dup2(null, fd)
+        finally:
+            os.close(null)
+    except (OSError, ValueError):
+        pass
+    sys.stdout.close()
 
-    if "--heatmap" in args:
-        cmd_heatmap()
-        return
 
-    if "--config" in args:
-        cmd_print_config()
-        return
+def _emit_status(line, config=None, cached_only=False):
+    """Write the final status line, with update indicators when a config is given.
+
+    With cached_only, the indicators come from cached update checks alone, so
+    nothing touches the network before the line goes out.
+    """
+    if sys.stdout.closed:
+        return  # a stale line already went out while the cache is revalidated
+    if config is not None:
+        if cached_only:
+            pulse_update = _cached_update_flag(PULSE_UPDATE_KEY)
+            claude_update = _cached_update_flag(CLAUDE_UPDATE_KEY)
+        else:
+            pulse_update, claude_update = _prefetch_update_checks(config) or (None, None)
+        line = append_update_indicator(line, config, pulse_update)
+        line = append_claude_update_indicator(line, config, claude_update)
+    # Cached, rendered, and indicator segments are already RESET-terminated
+    if not line.endswith(RESET):
+        line += RESET
+    # The status line is the process's only output — write it straight to the
+    # descriptor instead of through the buffered layer and its exit-time flush
+    data = memoryview((line + "\n").encode("utf-8"))
+    fd = sys.stdout.fileno()
+    while data:
+        data = data[os.write(fd, data):]
+
+
+def main():
+    # Handle SIGPIPE gracefully on Unix (e.g. when piped to head)
+    if hasattr(signal, "SIGPIPE"):
+        signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+    args = sys.argv[1:]
+
+    if args:
+        # One pass over argv: flag -> value following its first occurrence
+        values = {}
+        for i in range(len(args) - 1, -1, -1):
+            values[args[i]] = args[i + 1] if i + 1 < len(args) else None
+        for flag, handler, takes_value in _CLI_COMMANDS:
+            if flag in values:
+                if takes_value:
+                    handler(values[flag])
+                else:
+                    handler()
+                return
 
     # Normal status line mode
     config = load_config()
@@ -2580,58 +3269,59 @@ def main():
     except Exception:
         pass
 
-    raw_stdin = ""
-    if not sys.stdin.isatty():
-        try:
-            raw_stdin = sys.stdin.read(65536)
-        except Exception:
-            pass
-    stdin_ctx = _parse_stdin_context(raw_stdin)
+    # Raw bytes: json.loads detects UTF-8 itself, independent of the console code page
+    stdin_ctx = _parse_stdin_context(_read_stdin())
 
     # Persist stdin context (model, context %) in a separate file so it
     # survives across refreshes that don't receive stdin data from Claude Code.
     # Merge new data into persisted data so partial updates (e.g. model but
     # no context_pct during thinking) don't wipe previously known fields.
-    _STDIN_CTX_KEYS = {"model_name", "context_pct", "context_used", "context_limit", "cost_usd"}
-    stdin_ctx_path = get_state_dir() / "stdin_ctx.json"
-    persisted = {}
-    try:
-        with open(str(stdin_ctx_path), "r", encoding="utf-8") as f:
-            raw_persisted = json.load(f)
-            persisted = {k: _sanitize(str(v)) if isinstance(v, str) else v for k, v in raw_persisted.items() if k in _STDIN_CTX_KEYS}
-    except (FileNotFoundError, json.JSONDecodeError, OSError):
-        pass
+    persisted, log_size = _read_stdin_ctx()
     if stdin_ctx:
-        persisted.update(stdin_ctx)
-        try:
-            _atomic_json_write(stdin_ctx_path, persisted, indent=None)
-        except OSError:
-            pass
+        merged = {**persisted, **stdin_ctx}
+        if merged != persisted:  # most refreshes repeat the same model and context %
+            _write_stdin_ctx(merged, log_size)
+        persisted = merged
     stdin_ctx = persisted
 
-    cache_path = get_cache_path()
-    cached = read_cache(cache_path, cache_ttl)
+    cached = read_cache(STATUS_KEY, cache_ttl)
 
     if cached is not None:
         if "usage" in cached:
             line = build_status_line(cached["usage"], cached.get("plan", ""), config, stdin_ctx)
         else:
             line = cached.get("line", "")
-        line = append_update_indicator(line, config)
-        line = append_claude_update_indicator(line, config)
-        sys.stdout.buffer.write((line + RESET + "\n").encode("utf-8"))
+        if cached.get("stale"):
+            line += STALE_INDICATOR
+        # Line-only cache entries are error messages — no update indicators
+        _emit_status(line, config if "usage" in cached else None)
         return
 
+    # A recently expired render goes out now and the reader gets EOF at once;
+    # the fetch below then only refreshes the cache for the next refresh
+    recent = read_cache(STATUS_KEY, cache_ttl * REVALIDATE_TTL_FACTOR)
+    if recent is not None and "usage" in recent:
+        line = build_status_line(recent["usage"], recent.get("plan", ""), config, stdin_ctx)
+        if recent.get("stale"):
+            line += STALE_INDICATOR
+        _emit_status(line, config, cached_only=True)
+        _close_stdout()
+
+    import urllib.error  # only needed once we go to the network
+
     token, plan = get_credentials()
     if not token:
         if os.environ.get("ANTHROPIC_API_KEY"):
             line = "API key detected \u2014 claude-pulse requires a Pro/Max subscription"
         else:
             line = "No credentials \u2014 run claude and /login"
-        write_cache(cache_path, line)
-        sys.stdout.buffer.write((line + RESET + "\n").encode("utf-8"))
+        write_cache(STATUS_KEY, line)
+        _emit_status(line)
         return
 
+    # Transient failures (throttling, server errors, network) fall back to the
+    # last good render instead of re-hitting the API on every refresh
+    transient = False
     try:
         usage = fetch_usage(token)
         line = build_status_line(usage, plan, config, stdin_ctx)
@@ -2653,9 +3343,11 @@ def main():
             line = "Access denied \u2014 check your subscription"
         else:
             line = f"API error: {e.code}"
+            transient = True
     except urllib.error.URLError:
         usage = None
         line = "Network error \u2014 retrying next refresh"
+        transient = True
     except json.JSONDecodeError:
         usage = None
         line = "API returned invalid data"
@@ -2666,19 +3358,35 @@ def main():
         usage = None
         line = f"Usage unavailable: {type(e).__name__}"
 
+    if transient:
+        last_good = read_cache(LAST_GOOD_KEY, LAST_GOOD_TTL)
+        if last_good and "usage" in last_good:
+            last_plan = last_good.get("plan", "")
+            line = build_status_line(last_good["usage"], last_plan, config, stdin_ctx)
+            write_cache(STATUS_KEY, line, last_good["usage"], last_plan, stale=True)
+            line += STALE_INDICATOR
+            _emit_status(line, config)
+            return
+
     if usage is not None:
-        write_cache(cache_path, line, usage, plan)
-        _append_history(usage)
-        _update_heatmap(usage)
+        write_cache(STATUS_KEY, line, usage, plan)
+        write_cache(LAST_GOOD_KEY, line, usage, plan)
         try:
             stats, milestone = _update_stats()
             if milestone:
                 line = line + f" {BRIGHT_YELLOW}{milestone}{RESET}"
         except Exception:
             pass
-    line = append_update_indicator(line, config)
-    line = append_claude_update_indicator(line, config)
-    sys.stdout.buffer.write((line + RESET + "\n").encode("utf-8"))
+        _emit_status(line, config)
+        # History and heatmap don't affect this line — record them after the
+        # reader has its EOF, so it isn't held up by the writes or save_state
+        _close_stdout()
+        now_utc = datetime.now(timezone.utc)
+        _append_history(usage, now_utc.timestamp())
+        _update_heatmap(usage, now_utc)
+        return
+    # Error lines skip the update indicators
+    _emit_status(line)
 
 
 if __name__ == "__main__":